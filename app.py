@@ -1,24 +1,57 @@
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env
+load_dotenv()
+
+# The gevent dispatch engine needs a cooperative standard library, so patch it before anything else is imported
+if os.environ.get('DISPATCH_ENGINE', 'thread').lower() == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
 from flask import Flask, request, Response, render_template_string, jsonify, redirect, url_for, session, flash
-from flask_socketio import SocketIO
+from flask_socketio import SocketIO, join_room
 from twilio.rest import Client
-import os
+from twilio.http.async_http_client import AsyncTwilioHttpClient
+from twilio.base.exceptions import TwilioRestException
+import aiohttp
+import asyncio
 import random
 import logging
+import queue
+import threading
 from threading import Thread
-from dotenv import load_dotenv
-import urllib.parse
+import gevent
 import json
 import re
 from werkzeug.utils import secure_filename
+from requests.adapters import HTTPAdapter
+from werkzeug.wsgi import get_input_stream
 import time
 from twilio.twiml.voice_response import VoiceResponse
 import requests
+import urllib3
 import tempfile
 import uuid
 from urllib.parse import quote
 import glob
 import base64
 import functools
+import hashlib
+import shutil
+import subprocess
+import sqlite3
+import csv
+import io
+import mmap
+import bisect
+import heapq
+from abc import ABC, abstractmethod
+from array import array
+from collections import deque, OrderedDict
+from itertools import islice, repeat
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pydub import AudioSegment
 from flask import render_template, abort, send_from_directory
 from werkzeug.exceptions import BadRequest
 from geventwebsocket.handler import WebSocketHandler
@@ -26,9 +59,6 @@ from gevent.pywsgi import WSGIServer
 from flask_socketio import SocketIO, emit
 from datetime import datetime, timedelta
 
-# Load environment variables from .env
-load_dotenv()
-
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -72,12 +102,103 @@ base_url = os.environ['BASE_URL']
 # ElevenLabs configuration (optional)
 elevenlabs_api_key = os.environ.get('ELEVENLABS_API_KEY', '')
 elevenlabs_voices = json.loads(os.environ.get('ELEVENLABS_VOICES', '{}'))
+elevenlabs_model = os.environ.get('ELEVENLABS_MODEL', 'eleven_monolingual_v1')
+elevenlabs_stability = float(os.environ.get('ELEVENLABS_STABILITY', '0.5'))
+elevenlabs_similarity = float(os.environ.get('ELEVENLABS_SIMILARITY', '0.5'))
+
+# Synthesized speech is cached on disk by content, within a byte budget
+tts_cache_dir = os.environ.get('TTS_CACHE_DIR', os.path.join('static', 'mp3', 'tts-cache'))
+tts_cache_max_bytes = int(os.environ.get('TTS_CACHE_MAX_BYTES', str(200 * 1024 * 1024)))
+
+# Synthesize and cache greetings sentence by sentence, joining the segments with pydub
+tts_sentence_segments = os.environ.get('TTS_SENTENCE_SEGMENTS', 'true').lower() in ('1', 'true', 'yes')
+# Sentences of one greeting synthesized at once
+tts_segment_workers = int(os.environ.get('TTS_SEGMENT_WORKERS', '4'))
+
+# Most Eleven Labs requests in flight at once, across all campaigns
+elevenlabs_concurrency = int(os.environ.get('ELEVENLABS_CONCURRENCY', '3'))
+
+# Offline text-to-speech with an engine on this host (espeak-ng or piper); voices map names to
+# espeak-ng voices or piper model files
+local_tts_engine = os.environ.get('LOCAL_TTS_ENGINE', 'espeak-ng')
+local_tts_binary = os.environ.get('LOCAL_TTS_BINARY', local_tts_engine)
+local_tts_voices = json.loads(os.environ.get('LOCAL_TTS_VOICES', '{"English (US)": "en-us"}'))
+local_tts_concurrency = int(os.environ.get('LOCAL_TTS_CONCURRENCY', str(os.cpu_count() or 2)))
+local_tts_timeout = float(os.environ.get('LOCAL_TTS_TIMEOUT', '30'))
+
+# Templated greetings: workers that synthesize the distinct renderings before dialing, and the most renderings per campaign
+tts_prerender_workers = int(os.environ.get('TTS_PRERENDER_WORKERS', '8'))
+greeting_renderings_max = int(os.environ.get('GREETING_RENDERINGS_MAX', '1000'))
+
+# Connect and between-bytes read timeouts for Eleven Labs requests, in seconds
+elevenlabs_connect_timeout = float(os.environ.get('ELEVENLABS_CONNECT_TIMEOUT', '5'))
+elevenlabs_read_timeout = float(os.environ.get('ELEVENLABS_READ_TIMEOUT', '30'))
+
+# Seconds to wait on the chosen TTS provider before the fallback provider races it (off unless a fallback is set)
+tts_latency_budget = float(os.environ.get('TTS_LATENCY_BUDGET', '30'))
+tts_fallback_provider = os.environ.get('TTS_FALLBACK_PROVIDER', '')
 
 client = Client(account_sid, auth_token)
 
+# Call dispatch configuration
+dispatch_engine = os.environ.get('DISPATCH_ENGINE', 'thread').lower()
+dispatch_workers = int(os.environ.get('DISPATCH_WORKERS', '50'))
+max_simultaneous_calls = int(os.environ.get('MAX_SIMULTANEOUS_CALLS', '50'))
+dispatch_keepalive = float(os.environ.get('DISPATCH_KEEPALIVE', '60'))
+burst_gate_timeout = float(os.environ.get('BURST_GATE_TIMEOUT', '30'))
+
+# Calls-per-second limit for call creation (0 disables pacing)
+twilio_cps = float(os.environ.get('TWILIO_CPS', '5'))
+twilio_cps_burst = float(os.environ.get('TWILIO_CPS_BURST', str(max(twilio_cps, 1))))
+
+# Request rate and concurrency for hanging up live calls when a campaign is stopped
+hangup_rps = float(os.environ.get('HANGUP_RPS', '100'))
+hangup_concurrency = int(os.environ.get('HANGUP_CONCURRENCY', '50'))
+
+# Live-call slots whose final status callback never arrives: calls older than CALL_STATUS_POLL_AFTER
+# seconds are looked up on Twilio, and past CALL_LEASE_SECONDS (Twilio's 4-hour call limit) the slot is freed
+call_status_poll_after = float(os.environ.get('CALL_STATUS_POLL_AFTER', '300'))
+call_lease_seconds = float(os.environ.get('CALL_LEASE_SECONDS', '14400'))
+
+# Outcomes per adjustment window of the adaptive (AIMD) concurrency controller
+adaptive_window = int(os.environ.get('ADAPTIVE_WINDOW', '20'))
+
+# Retries of call creations rejected before Twilio accepted them (429, connection failures) with jittered backoff
+create_retries = int(os.environ.get('CREATE_RETRIES', '3'))
+create_retry_base = float(os.environ.get('CREATE_RETRY_BASE', '0.5'))
+create_retry_max = float(os.environ.get('CREATE_RETRY_MAX', '10'))
+
+# Per-campaign circuit breaker: pause dispatch when this share of recent create attempts fails (0 disables)
+breaker_error_rate = float(os.environ.get('BREAKER_ERROR_RATE', '0.5'))
+breaker_window = int(os.environ.get('BREAKER_WINDOW', '20'))
+breaker_cooldown = float(os.environ.get('BREAKER_COOLDOWN', '30'))
+
+# SQLite file holding campaigns and their dial queue, so list campaigns resume after a restart
+campaign_db_path = os.environ.get('CAMPAIGN_DB', 'campaigns.db')
+queue_batch_size = int(os.environ.get('QUEUE_BATCH_SIZE', '50'))
+
+# Uploaded number lists: validated, de-duplicated E.164 numbers stored on disk
+number_list_dir = os.environ.get('NUMBER_LIST_DIR', 'number_lists')
+number_list_max_bytes = int(os.environ.get('NUMBER_LIST_MAX_BYTES', str(512 * 1024 * 1024)))
+default_country_code = os.environ.get('DEFAULT_COUNTRY_CODE', '1')
+
+# Send TwiML inline with the call-create request when it is known at dispatch time, instead of a /twiml URL
+inline_twiml = os.environ.get('INLINE_TWIML', 'true').lower() == 'true'
+INLINE_TWIML_MAX_CHARS = 4000  # Twilio's limit on the Twiml parameter
+
+# Keep call plans in the campaign database too, so /twiml tokens survive a restart
+call_plan_persist = os.environ.get('CALL_PLAN_PERSIST', 'false').lower() == 'true'
+
+# Most call plans kept in memory, and seconds a finished campaign's plans are kept for calls still fetching /twiml
+call_plan_max = int(os.environ.get('CALL_PLAN_MAX', '10000'))
+call_plan_grace = float(os.environ.get('CALL_PLAN_GRACE', '600'))
+
 # In-memory storage for call statuses
 calls = {}
 
+# Call statuses after which Twilio sends no further updates
+TERMINAL_CALL_STATUSES = {'completed', 'busy', 'no-answer', 'failed', 'canceled'}
+
 # Authentication config
 admin_username = os.environ.get('ADMIN_USERNAME', 'admin')
 admin_password = os.environ.get('ADMIN_PASSWORD', 'password')
@@ -264,6 +385,7 @@ def generate_admin_html():
             voice_options += f'<option value="{name}">{name}</option>\n'
     else:
         voice_options = '<option value="">No voices available</option>'
+    local_voice_options = "".join(f'<option value="{name}">{name}</option>\n' for name in local_tts_voices)
     
     # Build the full HTML - escape all CSS curly braces with double braces
     html = """<!DOCTYPE html>
@@ -662,8 +784,21 @@ def generate_admin_html():
                         <form id="callForm">
                             <div class="form-group">
                                 <label for="phone_numbers">Phone Numbers (one per line)</label>
-                                <textarea class="form-control" id="phone_numbers" rows="5" required></textarea>
+                                <textarea class="form-control" id="phone_numbers" rows="5"></textarea>
                                 <small class="form-text">Enter one phone number per line in E.164 format (e.g., +15551234567)</small>
+                                <label for="number_list_file">Or Upload a Number List (CSV or TXT)</label>
+                                <input type="file" class="form-control-file" id="number_list_file" accept=".csv,.txt,text/csv,text/plain">
+                                <small class="form-text" id="numberListStatus">Large lists are validated, normalized to E.164 and de-duplicated as they upload.</small>
+                                <label for="saved_number_list">Or Use a Saved Number List</label>
+                                <select class="form-control" id="saved_number_list">
+                                    <option value="">None</option>
+                                </select>
+                            </div>
+                            
+                            <div class="form-group">
+                                <label for="dnc_file">Add to Do-Not-Call List (CSV or TXT)</label>
+                                <input type="file" class="form-control-file" id="dnc_file" accept=".csv,.txt,text/csv,text/plain">
+                                <small class="form-text" id="dncStatus"></small>
                             </div>
                             
                             <div class="form-group">
@@ -672,11 +807,108 @@ def generate_admin_html():
                             </div>
                             
                             <div class="form-group">
-                                <label for="simultaneous_calls">Simultaneous Calls (1-50, single number only)</label>
-                                <input type="number" class="form-control" id="simultaneous_calls" value="1" min="1" max="50">
+                                <label for="simultaneous_calls">Simultaneous Calls (1-{max_calls}, single number only)</label>
+                                <input type="number" class="form-control" id="simultaneous_calls" value="1" min="1" max="{max_calls}">
                                 <small class="form-text">Only works when calling a single phone number. For multiple numbers, set to 1.</small>
                             </div>
                             
+                            <div class="form-group">
+                                <label for="campaign_mode">Campaign Mode</label>
+                                <select class="form-control" id="campaign_mode">
+                                    <option value="standard" selected>Standard (dial the list once)</option>
+                                    <option value="soak">Soak (hold N live calls)</option>
+                                    <option value="arrival">Arrival Rate (calls per hour)</option>
+                                    <option value="parallel">Parallel (many numbers at once)</option>
+                                    <option value="burst">Burst (release calls at the same instant)</option>
+                                    <option value="adaptive">Adaptive (find the highest sustainable live calls)</option>
+                                </select>
+                            </div>
+                            
+                            <div id="soak_settings_container" class="form-group">
+                                <label for="soak_target">Live Calls to Hold (soak)</label>
+                                <input type="number" class="form-control" id="soak_target" value="10" min="1" max="{max_calls}">
+                                <small class="form-text">A replacement call is placed as soon as any live call ends.</small>
+                            </div>
+                            
+                            <div id="arrival_settings_container" class="form-group">
+                                <label for="calls_per_hour">Arrival Rate (calls per hour)</label>
+                                <input type="number" class="form-control" id="calls_per_hour" value="1800" min="0" step="any">
+                                <label for="arrival_distribution">Arrival Distribution</label>
+                                <select class="form-control" id="arrival_distribution">
+                                    <option value="constant" selected>Constant spacing</option>
+                                    <option value="poisson">Poisson (random arrivals)</option>
+                                    <option value="curve">Custom rate curve</option>
+                                </select>
+                                <label for="rate_curve">Rate Curve (one "minute, calls per hour" point per line)</label>
+                                <textarea class="form-control" id="rate_curve" rows="3" placeholder="0, 600&#10;30, 1800&#10;60, 600"></textarea>
+                            </div>
+                            
+                            <div id="parallel_settings_container" class="form-group">
+                                <label for="calls_per_destination">Calls per Number (parallel)</label>
+                                <input type="number" class="form-control" id="calls_per_destination" value="1" min="1">
+                                <label for="per_destination_cap">Live Calls per Number</label>
+                                <input type="number" class="form-control" id="per_destination_cap" value="1" min="1">
+                                <label for="global_cap">Live Calls Across All Numbers</label>
+                                <input type="number" class="form-control" id="global_cap" value="10" min="1" max="{max_calls}">
+                                <small class="form-text">Numbers are served round-robin; a number at its cap is skipped, not waited on.</small>
+                            </div>
+                            
+                            <div id="burst_settings_container" class="form-group">
+                                <label for="burst_size">Burst Size (burst)</label>
+                                <input type="number" class="form-control" id="burst_size" value="10" min="1" max="{max_calls}">
+                                <small class="form-text">All calls are prepared first, then released together through a barrier.</small>
+                            </div>
+                            
+                            <div id="adaptive_settings_container" class="form-group">
+                                <label for="adaptive_initial">Starting Live Calls (adaptive)</label>
+                                <input type="number" class="form-control" id="adaptive_initial" value="5" min="1" max="{max_calls}">
+                                <label for="adaptive_max">Maximum Live Calls</label>
+                                <input type="number" class="form-control" id="adaptive_max" value="{max_calls}" min="1" max="{max_calls}">
+                                <label for="adaptive_error_percent">Failure Rate Threshold (%)</label>
+                                <input type="number" class="form-control" id="adaptive_error_percent" value="20" min="0" max="100" step="any">
+                                <label for="adaptive_latency_ms">API Latency Threshold (p90 ms, 0 = ignore)</label>
+                                <input type="number" class="form-control" id="adaptive_latency_ms" value="2000" min="0">
+                                <small class="form-text">The limit grows by one call per healthy window and halves on failures, 429s or slow API responses.</small>
+                            </div>
+                            
+                            <div id="load_profile_container" class="form-group">
+                                <label for="profile_shape">Load Profile (soak: live calls, arrival: calls per hour)</label>
+                                <select class="form-control" id="profile_shape">
+                                    <option value="none" selected>None (flat load)</option>
+                                    <option value="ramp">Ramp</option>
+                                    <option value="step">Step</option>
+                                    <option value="spike">Spike</option>
+                                    <option value="custom">Custom</option>
+                                </select>
+                                <label for="profile_start">Start Load</label>
+                                <input type="number" class="form-control" id="profile_start" value="0" min="0" step="any">
+                                <label for="profile_peak">Peak Load</label>
+                                <input type="number" class="form-control" id="profile_peak" value="50" min="0" step="any">
+                                <label for="profile_minutes">Ramp Length, Step Interval or Spike Start (minutes)</label>
+                                <input type="number" class="form-control" id="profile_minutes" value="10" min="0" step="any">
+                                <label for="profile_hold_minutes">Hold at Peak (minutes)</label>
+                                <input type="number" class="form-control" id="profile_hold_minutes" value="10" min="0" step="any">
+                                <label for="profile_steps">Number of Steps (step profile)</label>
+                                <input type="number" class="form-control" id="profile_steps" value="4" min="1">
+                                <label for="profile_points">Custom Points (one "minute, load" point per line)</label>
+                                <textarea class="form-control" id="profile_points" rows="3" placeholder="0, 0&#10;10, 200&#10;20, 200&#10;20, 400"></textarea>
+                                <label for="profile_interpolation">Custom Interpolation</label>
+                                <select class="form-control" id="profile_interpolation">
+                                    <option value="linear" selected>Linear</option>
+                                    <option value="step">Step (hold until next point)</option>
+                                </select>
+                            </div>
+                            
+                            <div class="form-group">
+                                <label for="campaign_duration">Campaign Duration (minutes, 0 = until stopped)</label>
+                                <input type="number" class="form-control" id="campaign_duration" value="10" min="0" step="any">
+                            </div>
+                            
+                            <div class="form-group">
+                                <label for="campaign_max_calls">Maximum Calls (0 = unlimited)</label>
+                                <input type="number" class="form-control" id="campaign_max_calls" value="0" min="0">
+                            </div>
+                            
                             <div class="form-check">
                                 <input type="checkbox" class="form-check-input" id="use_custom_greeting">
                                 <label class="form-check-label" for="use_custom_greeting">Custom Intro Text-to-Speech</label>
@@ -685,6 +917,12 @@ def generate_admin_html():
                             <div id="custom_greeting_container" class="form-group">
                                 <label for="custom_greeting">Custom Greeting Text</label>
                                 <textarea class="form-control" id="custom_greeting" rows="3" placeholder="Enter your custom greeting text here..."></textarea>
+                                <small class="form-text text-muted">Use {{column}} or {{column|default}} to fill in a column of the selected number list, or {{phone_number}}.</small>
+                            </div>
+                            
+                            <div class="form-check">
+                                <input type="checkbox" class="form-check-input" id="hang_up_on_stop" checked>
+                                <label class="form-check-label" for="hang_up_on_stop">Hang up live calls when stopping</label>
                             </div>
                             
                             <div class="form-actions" style="display: flex; gap: 10px; margin-top: 20px;">
@@ -759,6 +997,12 @@ def generate_admin_html():
                                     Eleven Labs
                                 </label>
                             </div>
+                            <div class="form-check">
+                                <input class="form-check-input" type="radio" name="tts_provider" id="local_tts" value="local">
+                                <label class="form-check-label" for="local_tts">
+                                    Local (offline)
+                                </label>
+                            </div>
                             
                             <div id="eleven_labs_voices_container" class="form-group mt-2">
                                 <label for="eleven_labs_voice">Select Voice</label>
@@ -766,6 +1010,13 @@ def generate_admin_html():
                                     {voice_options}
                                 </select>
                             </div>
+                            
+                            <div id="local_voices_container" class="form-group mt-2">
+                                <label for="local_voice">Select Local Voice</label>
+                                <select class="form-control" id="local_voice">
+                                    {local_voice_options}
+                                </select>
+                            </div>
                         </div>
                         
                         <div class="form-check mb-3">
@@ -783,6 +1034,14 @@ def generate_admin_html():
         
         <div id="status" class="mt-4">
             <h3>Call Status</h3>
+            <div id="activeCampaigns"></div>
+            <small class="form-text" id="dispatcherStats"></small>
+            <small class="form-text" id="loadStats"></small>
+            <small class="form-text" id="hangupStats"></small>
+            <small class="form-text" id="burstStats"></small>
+            <small class="form-text" id="breakerStats"></small>
+            <small class="form-text" id="prepStats"></small>
+            <canvas id="loadChart" width="1100" height="160" style="width: 100%; margin: 10px 0; background: #0F172A; border-radius: 6px;"></canvas>
             <div id="callStatus"></div>
         </div>
         
@@ -829,9 +1088,15 @@ def generate_admin_html():
             // Connect to Socket.IO
             const socket = io();
             
+            // ID of the campaign started from this page
+            let currentCampaignId = null;
+            let numberListId = null;
+            
             // Add debugging for Socket.IO connection events
             socket.on('connect', function() {{
                 console.log('Socket.IO connected successfully with ID:', socket.id);
+                // The server puts this page in the room of the user's campaigns; pick up any still running
+                refreshCampaigns();
             }});
             
             socket.on('connect_error', function(error) {{
@@ -858,8 +1123,8 @@ def generate_admin_html():
                 const phoneNumbers = $('#phone_numbers').val().split('\\n').filter(n => n.trim() !== '');
                 console.log('Phone numbers:', phoneNumbers);
                 
-                if (phoneNumbers.length === 0) {{
-                    alert('Please enter at least one phone number.');
+                if (phoneNumbers.length === 0 && !numberListId) {{
+                    alert('Please enter at least one phone number or upload a number list.');
                     return;
                 }}
                 
@@ -868,13 +1133,13 @@ def generate_admin_html():
                 const simultaneous_calls = $('#simultaneous_calls').val();
                 
                 // Validate simultaneous calls
-                if (phoneNumbers.length > 1 && parseInt(simultaneous_calls) > 1) {{
+                if ($('#campaign_mode').val() === 'standard' && phoneNumbers.length > 1 && parseInt(simultaneous_calls) > 1) {{
                     alert('Simultaneous calls (>1) can only be used with a single phone number.');
                     return;
                 }}
                 
-                // Cap simultaneous calls at 50
-                const finalSimultaneousCalls = Math.min(parseInt(simultaneous_calls), 50);
+                // Cap simultaneous calls at the server limit
+                const finalSimultaneousCalls = Math.min(parseInt(simultaneous_calls), {max_calls});
                 
                 const useCustomGreeting = $('#use_custom_greeting').is(':checked');
                 const customGreeting = $('#custom_greeting').val();
@@ -883,20 +1148,27 @@ def generate_admin_html():
                 const mp3File = $('#mp3_file').val();
                 const ttsProvider = $('input[name="tts_provider"]:checked').val();
                 console.log("Selected TTS provider:", ttsProvider);
-                const elevenLabsVoice = $('#eleven_labs_voice').val();
+                const elevenLabsVoice = ttsProvider === 'local' ? $('#local_voice').val() : $('#eleven_labs_voice').val();
                 const saveTts = $('#save_tts').is(':checked');
+                const campaignMode = $('#campaign_mode').val();
                 
                 // Disable start button, enable stop button
                 $('#startButton').prop('disabled', true);
                 $('#stopButton').prop('disabled', false);
                 
-                // Clear previous call status
+                // Clear previous call status and load history
                 $('#callStatus').empty();
+                $('#breakerStats').text('');
+                $('#prepStats').text('');
+                loadHistory = [];
+                drawLoadChart();
                 
                 // Send data to server
+                currentCampaignId = null;
                 console.log("Emitting start_calls event to server with TTS provider:", ttsProvider);
                 socket.emit('start_calls', {{
                     phone_numbers: phoneNumbers,
+                    number_list_id: numberListId,
                     delay: delay,
                     simultaneous_calls: finalSimultaneousCalls,
                     use_custom_greeting: useCustomGreeting,
@@ -906,17 +1178,83 @@ def generate_admin_html():
                     mp3_file: mp3File,
                     tts_provider: ttsProvider,
                     eleven_labs_voice: elevenLabsVoice,
-                    save_tts: saveTts
+                    save_tts: saveTts,
+                    campaign_mode: campaignMode,
+                    soak_target: $('#soak_target').val(),
+                    campaign_duration: $('#campaign_duration').val(),
+                    campaign_max_calls: $('#campaign_max_calls').val(),
+                    calls_per_hour: $('#calls_per_hour').val(),
+                    arrival_distribution: $('#arrival_distribution').val(),
+                    rate_curve: $('#rate_curve').val(),
+                    profile_shape: $('#profile_shape').val(),
+                    profile_start: $('#profile_start').val(),
+                    profile_peak: $('#profile_peak').val(),
+                    profile_minutes: $('#profile_minutes').val(),
+                    profile_hold_minutes: $('#profile_hold_minutes').val(),
+                    profile_steps: $('#profile_steps').val(),
+                    profile_points: $('#profile_points').val(),
+                    profile_interpolation: $('#profile_interpolation').val(),
+                    calls_per_destination: $('#calls_per_destination').val(),
+                    per_destination_cap: $('#per_destination_cap').val(),
+                    global_cap: $('#global_cap').val(),
+                    burst_size: $('#burst_size').val(),
+                    adaptive_initial: $('#adaptive_initial').val(),
+                    adaptive_max: $('#adaptive_max').val(),
+                    adaptive_error_percent: $('#adaptive_error_percent').val(),
+                    adaptive_latency_ms: $('#adaptive_latency_ms').val()
+                }}, function(response) {{
+                    if (response && response.campaign_id) {{
+                        currentCampaignId = response.campaign_id;
+                        console.log('Campaign started:', currentCampaignId);
+                    }}
+                    if (response && response.status === 'error') {{
+                        alert(response.message);
+                        $('#startButton').prop('disabled', false);
+                        $('#stopButton').prop('disabled', true);
+                    }}
                 }});
             }});
             
             // Handle stop button click
             $('#stopButton').click(function() {{
-                socket.emit('stop_calls');
+                socket.emit('stop_calls', {{
+                    campaign_id: currentCampaignId,
+                    hang_up: $('#hang_up_on_stop').is(':checked')
+                }}, refreshCampaigns);
                 $('#startButton').prop('disabled', false);
                 $('#stopButton').prop('disabled', true);
             }});
             
+            // List the user's active campaigns, each with its own stop control
+            function refreshCampaigns() {{
+                $.getJSON('/api/campaigns', function(response) {{
+                    const active = response.campaigns.filter(c => c.status === 'pending' || c.status === 'running');
+                    $('#activeCampaigns').empty();
+                    active.forEach(function(c) {{
+                        $('#activeCampaigns').append(
+                            $('<div class="call-status in-progress"></div>')
+                                .text('Campaign ' + c.campaign_id + ' (' + c.mode + '): ' + c.status + ', ' +
+                                      c.counters.placed + ' placed ')
+                                .append($('<button type="button" class="btn btn-danger btn-sm">Stop</button>')
+                                    .click(function() {{ stopCampaign(c.campaign_id); }}))
+                        );
+                    }});
+                    if (active.length) {{
+                        // After a reload the page no longer knows which campaign it started
+                        if (!active.some(c => c.campaign_id === currentCampaignId)) {{
+                            currentCampaignId = active[active.length - 1].campaign_id;
+                        }}
+                        $('#stopButton').prop('disabled', false);
+                    }}
+                }});
+            }}
+            
+            function stopCampaign(campaignId) {{
+                $.post('/api/campaigns/' + campaignId + '/stop', {{
+                    hang_up: $('#hang_up_on_stop').is(':checked')
+                }}, refreshCampaigns);
+            }}
+            
             // Handle call status updates
             socket.on('call_status', function(data) {{
                 const statusClass = data.status === 'pending' ? 'pending' :
@@ -939,12 +1277,114 @@ def generate_admin_html():
                 }}
             }});
             
+            // Target vs achieved load history for the chart, halved in resolution whenever it reaches the cap
+            const LOAD_HISTORY_MAX = 600;
+            let loadHistory = [];
+            
+            function drawLoadChart() {{
+                const canvas = document.getElementById('loadChart');
+                const ctx = canvas.getContext('2d');
+                ctx.clearRect(0, 0, canvas.width, canvas.height);
+                if (loadHistory.length < 2) {{
+                    return;
+                }}
+                
+                const maxTime = loadHistory[loadHistory.length - 1].elapsed || 1;
+                const maxLoad = loadHistory.reduce((m, p) => Math.max(m, p.target, p.achieved), 1);
+                const x = t => 10 + (canvas.width - 20) * t / maxTime;
+                const y = v => canvas.height - 10 - (canvas.height - 20) * v / maxLoad;
+                
+                [['target', '#A0AEC0'], ['achieved', '#6366F1']].forEach(function([key, color]) {{
+                    ctx.strokeStyle = color;
+                    ctx.lineWidth = 2;
+                    ctx.beginPath();
+                    loadHistory.forEach(function(p, i) {{
+                        if (i === 0) {{
+                            ctx.moveTo(x(p.elapsed), y(p[key]));
+                        }} else {{
+                            ctx.lineTo(x(p.elapsed), y(p[key]));
+                        }}
+                    }});
+                    ctx.stroke();
+                }});
+                
+                ctx.fillStyle = '#94A3B8';
+                ctx.font = '12px Inter, sans-serif';
+                ctx.fillText('max ' + Math.round(maxLoad) + ' ' + loadHistory[0].unit + ' (grey: target, blue: achieved)', 14, 18);
+            }}
+            
+            // Handle live load updates from soak and arrival-rate campaigns
+            socket.on('load_stats', function(stats) {{
+                $('#loadStats').text(
+                    'Load: ' + stats.achieved + ' / ' + stats.target + ' ' + stats.unit + ' target, ' +
+                    stats.live + ' live, ' + stats.placed + ' placed, ' + stats.elapsed + 's elapsed' +
+                    (stats.adaptive ? ' | AIMD limit ' + stats.adaptive.limit + '/' + stats.adaptive.maximum +
+                        ', failure rate ' + Math.round(stats.adaptive.error_rate * 100) + '%, p90 API ' +
+                        stats.adaptive.p90_latency_ms + ' ms' +
+                        (stats.adaptive.last_decrease_reason ? ', last cut: ' + stats.adaptive.last_decrease_reason : '') : '')
+                );
+                loadHistory.push(stats);
+                if (loadHistory.length > LOAD_HISTORY_MAX) {{
+                    // Keep every other point, and always the latest, so the chart still spans the whole run
+                    loadHistory = loadHistory.filter((p, i) => i % 2 === 0 || i === loadHistory.length - 1);
+                }}
+                drawLoadChart();
+            }});
+            
+            // Handle the timing report of a burst campaign
+            socket.on('burst_report', function(report) {{
+                $('#burstStats').text(
+                    'Burst: ' + report.sent + '/' + report.size + ' requests sent' +
+                    (report.requested_size > report.size ? ' (capped from ' + report.requested_size + ')' : '') +
+                    (report.sent ? ', request spread ' + report.request_spread_ms + ' ms, response spread ' +
+                        report.response_spread_ms + ' ms, mean latency ' + report.mean_latency_ms + ' ms' : '') +
+                    (report.failed ? ', ' + report.failed + ' failed' : '')
+                );
+            }});
+            
+            // Handle the campaign preparation stage before the first dial
+            socket.on('campaign_prep', function(prep) {{
+                $('#prepStats').text('Preparation: ' + prep.message);
+            }});
+            
+            // Handle circuit breaker state changes
+            socket.on('circuit_breaker', function(breaker) {{
+                $('#breakerStats').text(
+                    breaker.state === 'open'
+                        ? 'Circuit breaker open: call creation is failing, dispatch paused for ' + breaker.reopens_in + 's'
+                        : 'Circuit breaker ' + breaker.state + ' (tripped ' + breaker.trips + ' times)'
+                );
+            }});
+            
+            // Handle bulk hang-up progress after a stop
+            socket.on('hangup_progress', function(progress) {{
+                $('#hangupStats').text(
+                    'Hang-up: ' + progress.ended + '/' + progress.total + ' live calls ended' +
+                    (progress.failed ? ', ' + progress.failed + ' failed' : '') + ' in ' + progress.elapsed + 's'
+                );
+            }});
+            
             // Handle all calls completed
             socket.on('all_calls_completed', function() {{
                 $('#startButton').prop('disabled', false);
                 $('#stopButton').prop('disabled', true);
+                refreshCampaigns();
             }});
             
+            // Poll the dispatcher for queue depth and worker utilization
+            function refreshDispatcherStats() {{
+                $.getJSON('/api/dispatcher-stats', function(stats) {{
+                    $('#dispatcherStats').text(
+                        'Dispatcher (' + stats.engine + '): ' + stats.busy_workers + '/' + stats.workers +
+                        ' workers busy, ' + stats.queue_depth + ' queued, ' +
+                        Math.round(stats.utilization * 100) + '% utilization'
+                    );
+                }});
+            }}
+            refreshDispatcherStats();
+            setInterval(refreshDispatcherStats, 2000);
+            setInterval(refreshCampaigns, 5000);
+            
             // MP3 files and Eleven Labs voices are pre-populated by Python
             console.log("MP3 files and Eleven Labs voices pre-populated");
             
@@ -966,6 +1406,91 @@ def generate_admin_html():
                 // We're not hiding/showing anymore, just tracking state
             }});
             
+            // Stream an uploaded number list to the server as the raw request body
+            $('#number_list_file').change(function() {{
+                const file = this.files[0];
+                numberListId = null;
+                if (!file) {{
+                    $('#numberListStatus').text('');
+                    return;
+                }}
+                $('#numberListStatus').text('Importing ' + file.name + '...');
+                fetch('/api/number-lists?name=' + encodeURIComponent(file.name), {{
+                    method: 'POST',
+                    headers: {{'Content-Type': 'text/plain'}},
+                    body: file
+                }})
+                    .then(response => response.json())
+                    .then(function(result) {{
+                        if (result.status !== 'success') {{
+                            $('#numberListStatus').text('Import failed: ' + result.message);
+                            return;
+                        }}
+                        numberListId = result.list.list_id;
+                        refreshNumberLists();
+                        $('#numberListStatus').text(
+                            'Using ' + file.name + ': ' + result.list.count + ' numbers (' + result.list.duplicates +
+                            ' duplicates and ' + result.list.invalid + ' invalid rows dropped). It replaces the numbers typed above.'
+                        );
+                    }})
+                    .catch(function(error) {{
+                        $('#numberListStatus').text('Import failed: ' + error);
+                    }});
+            }});
+            
+            // Saved number lists can be reused across runs
+            function refreshNumberLists() {{
+                $.getJSON('/api/number-lists', function(result) {{
+                    const select = $('#saved_number_list');
+                    select.find('option:not(:first)').remove();
+                    result.number_lists.forEach(function(list) {{
+                        select.append($('<option>').val(list.list_id).text(
+                            (list.name || list.list_id) + ' (' + list.count + ' numbers, ' + list.created_at.slice(0, 16) + ')'
+                        ));
+                    }});
+                    select.val(numberListId || '');
+                }});
+            }}
+            refreshNumberLists();
+            
+            $('#saved_number_list').change(function() {{
+                numberListId = $(this).val() || null;
+                $('#number_list_file').val('');
+                $('#numberListStatus').text(numberListId ? 'Using the saved list. It replaces the numbers typed above.' : '');
+            }});
+            
+            // Do-not-call numbers are added to the server's suppression list and skipped before every dial
+            function refreshDncStats() {{
+                $.getJSON('/api/dnc', function(stats) {{
+                    $('#dncStatus').text(stats.count + ' numbers on the do-not-call list');
+                }});
+            }}
+            refreshDncStats();
+            
+            $('#dnc_file').change(function() {{
+                const file = this.files[0];
+                if (!file) {{
+                    return;
+                }}
+                $('#dncStatus').text('Importing ' + file.name + '...');
+                fetch('/api/dnc', {{
+                    method: 'POST',
+                    headers: {{'Content-Type': 'text/plain'}},
+                    body: file
+                }})
+                    .then(response => response.json())
+                    .then(function(result) {{
+                        if (result.status !== 'success') {{
+                            $('#dncStatus').text('Import failed: ' + result.message);
+                            return;
+                        }}
+                        $('#dncStatus').text(result.dnc.added + ' numbers added, ' + result.dnc.count + ' on the do-not-call list');
+                    }})
+                    .catch(function(error) {{
+                        $('#dncStatus').text('Import failed: ' + error);
+                    }});
+            }});
+            
             // Validate simultaneous calls - only allow >1 for single phone number
             $('#phone_numbers, #simultaneous_calls').on('input change', function() {{
                 const phoneNumbers = $('#phone_numbers').val().split('\\n').filter(n => n.trim() !== '');
@@ -983,7 +1508,8 @@ def generate_admin_html():
 """
     
     # Format the HTML with the options
-    return html.format(mp3_options=mp3_options, voice_options=voice_options)
+    return html.format(mp3_options=mp3_options, voice_options=voice_options, local_voice_options=local_voice_options,
+                       max_calls=max_simultaneous_calls)
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -1031,10 +1557,22 @@ def initiate_calls():
     logger.info("Legacy initiate_calls endpoint accessed, redirecting to main page")
     return redirect(url_for('index'))
 
+def campaign_room(owner):
+    """The Socket.IO room of a user's campaigns; every page the user has open joins it."""
+    return f"user:{owner}"
+
 @socketio.on('connect')
 def handle_connect():
-    """Handle client connection."""
-    logger.info(f"Client connected: {request.sid}")
+    """Handle client connection, joining the room of the logged-in user's campaigns.
+
+    Campaigns belong to the user rather than the socket, so a page reload or
+    reconnect picks up the events of campaigns that are still running.
+    """
+    if not is_authenticated():
+        logger.warning(f"Rejected Socket.IO connection without a login: {request.sid}")
+        return False
+    join_room(campaign_room(session.get('username')))
+    logger.info(f"Client connected: {request.sid} ({session.get('username')})")
 
 @socketio.on('disconnect')
 def handle_disconnect():
@@ -1050,18 +1588,25 @@ def handle_start_calls(data):
     try:
         # Extract data
         phone_numbers = data.get('phone_numbers', [])
-        logger.info(f"Phone numbers to call: {phone_numbers}")
+        number_list = NumberList(data['number_list_id']) if data.get('number_list_id') else None
+        if number_list:
+            # An uploaded list replaces the numbers typed into the form
+            phone_numbers = []
+            logger.info(f"Phone numbers to call: list {number_list.list_id} with {len(number_list)} numbers")
+        else:
+            logger.info(f"Phone numbers to call: {phone_numbers}")
+        number_count = len(number_list) if number_list else len(phone_numbers)
         
         delay = int(data.get('delay', 5))
         simultaneous_calls = int(data.get('simultaneous_calls', 1))
         
-        # Server-side validation for simultaneous calls
-        if len(phone_numbers) > 1 and simultaneous_calls > 1:
+        # Server-side validation for simultaneous calls (parallel campaigns use their own caps)
+        if data.get('campaign_mode', 'standard') == 'standard' and number_count > 1 and simultaneous_calls > 1:
             logger.warning("Attempted to use simultaneous calls with multiple phone numbers")
             simultaneous_calls = 1  # Force to 1 for multiple numbers
         
-        # Cap simultaneous calls at 50
-        simultaneous_calls = min(simultaneous_calls, 50)
+        # Cap simultaneous calls at the configured maximum
+        simultaneous_calls = min(simultaneous_calls, max_simultaneous_calls)
         
         use_custom_greeting = data.get('use_custom_greeting', False)
         custom_greeting = data.get('custom_greeting', '')
@@ -1073,13 +1618,12 @@ def handle_start_calls(data):
         tts_provider = data.get('tts_provider', 'twilio')
         eleven_labs_voice = data.get('eleven_labs_voice', '')
         save_tts = data.get('save_tts', False)
+        mode_options = parse_campaign_options(data)
+        mode_options['number_list'] = number_list.list_id if number_list else None
         
-        logger.info(f"Starting call thread with: mode={playback_mode}, provider={tts_provider}, simultaneous={simultaneous_calls}")
-        
-        # Start a thread to make calls
-        thread = Thread(target=make_calls, args=(
-            phone_numbers, 
-            delay, 
+        campaign = Campaign(
+            phone_numbers,
+            delay,
             simultaneous_calls,
             use_custom_greeting,
             custom_greeting,
@@ -1089,334 +1633,3505 @@ def handle_start_calls(data):
             tts_provider,
             eleven_labs_voice,
             save_tts,
-            request.sid
-        ))
-        thread.daemon = True
-        thread.start()
-        logger.info(f"Call thread started successfully")
+            session.get('username'),
+            mode_options
+        )
+        campaign_store.add_campaign(campaign)
+        register_campaign(campaign)
+        logger.info(f"Starting campaign {campaign.id} with: mode={playback_mode}, provider={tts_provider}, simultaneous={simultaneous_calls}, campaign={mode_options}")
         
-        return {'status': 'success', 'message': 'Calls initiated'}
+        start_campaign(campaign)
+        
+        return {'status': 'success', 'message': 'Calls initiated', 'campaign_id': campaign.id}
     except Exception as e:
         logger.error(f"Error in handle_start_calls: {str(e)}", exc_info=True)
         return {'status': 'error', 'message': f'Error initiating calls: {str(e)}'}
 
+def parse_campaign_options(data):
+    """Extract the campaign mode and its load settings from a start_calls request."""
+    options = {
+        'mode': data.get('campaign_mode', 'standard'),
+        'soak_target': min(int(data.get('soak_target') or 1), max_simultaneous_calls),
+        'duration_minutes': float(data.get('campaign_duration') or 0),
+        'max_calls': int(data.get('campaign_max_calls') or 0),
+        'calls_per_hour': float(data.get('calls_per_hour') or 0),
+        'arrival_distribution': data.get('arrival_distribution', 'constant'),
+        'rate_curve': parse_curve(data.get('rate_curve', '')),
+        'load_profile': build_load_profile(data),
+        'calls_per_destination': max(1, int(data.get('calls_per_destination') or 1)),
+        'per_destination_cap': max(1, int(data.get('per_destination_cap') or 1)),
+        'global_cap': max(1, min(int(data.get('global_cap') or 1), max_simultaneous_calls)),
+        'burst_size': max(1, min(int(data.get('burst_size') or 1), max_simultaneous_calls)),
+        'adaptive_initial': max(1, int(data.get('adaptive_initial') or 1)),
+        'adaptive_max': max(1, min(int(data.get('adaptive_max') or max_simultaneous_calls), max_simultaneous_calls)),
+        'adaptive_error_rate': float(data.get('adaptive_error_percent') or 20) / 100,
+        'adaptive_latency_ms': float(data.get('adaptive_latency_ms') or 0)
+    }
+    if options['mode'] == 'arrival' and options['arrival_distribution'] == 'curve' and not options['rate_curve']:
+        raise ValueError("A rate curve is required for the custom curve arrival distribution")
+    if options['load_profile'] and options['mode'] not in ('soak', 'arrival'):
+        raise ValueError("Load profiles apply to soak and arrival-rate campaigns only")
+    return options
+
+def build_load_profile(data):
+    """Build the load profile selected in a start_calls request, or None for a flat load.
+
+    Profile values are live-call targets for soak campaigns and calls per
+    hour for arrival-rate campaigns.
+    """
+    shape = data.get('profile_shape', 'none')
+    if shape == 'none':
+        return None
+    
+    start = float(data.get('profile_start') or 0)
+    peak = float(data.get('profile_peak') or 0)
+    period = float(data.get('profile_minutes') or 0) * 60
+    hold = float(data.get('profile_hold_minutes') or 0) * 60
+    step = False
+    
+    if shape == 'ramp':
+        # Linear ramp from start to peak, then hold
+        points = [(0, start), (period, peak), (period + hold, peak)]
+    elif shape == 'step':
+        # Equal steps from start to peak, one every period
+        steps = max(1, int(data.get('profile_steps') or 1))
+        points = [(i * period, start + (peak - start) * i / steps) for i in range(steps + 1)]
+        step = True
+    elif shape == 'spike':
+        # Instantaneous jump to peak at `period`, held for `hold`, then back to start
+        points = [(0, start), (period, start), (period, peak), (period + hold, peak), (period + hold, start)]
+    elif shape == 'custom':
+        points = parse_curve(data.get('profile_points', ''))
+        step = data.get('profile_interpolation') == 'step'
+    else:
+        raise ValueError(f"Unknown load profile shape: {shape}")
+    
+    if not points:
+        raise ValueError("The custom load profile has no points")
+    return {'shape': shape, 'points': points, 'step': step}
+
+def parse_curve(text):
+    """Parse 'minute, value' lines into a list of (seconds, value) points sorted by time.
+
+    Points at the same minute keep the order they were written in, so they
+    make a step from the first value to the second.
+    """
+    points = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = [p.strip() for p in line.split(',')]
+        if len(parts) != 2:
+            raise ValueError(f"Invalid curve point '{line}', expected 'minute, value'")
+        points.append((float(parts[0]) * 60, float(parts[1])))
+    return sorted(points, key=lambda point: point[0])
+
+def interpolate_curve(points, t, step=False):
+    """Return the value of a curve at t seconds, holding the end values outside it.
+
+    Points are joined linearly, or held until the next point when step is
+    True. Two points at the same time make an instantaneous jump.
+    """
+    if not points:
+        return 0.0
+    if t <= points[0][0]:
+        return points[0][1]
+    for (t0, v0), (t1, v1) in zip(points, points[1:]):
+        if t < t1:
+            if step:
+                return v0
+            return v0 + (v1 - v0) * (t - t0) / (t1 - t0)
+    return points[-1][1]
+
+def profile_value(profile, t):
+    """Return a load profile's target at t seconds into the campaign."""
+    return interpolate_curve(profile['points'], t, profile['step'])
+
 @socketio.on('stop_calls')
-def handle_stop_calls():
-    """Handle stop calls request from client."""
-    logger.info("Received stop_calls request")
-    # Set a flag to stop making calls
-    global stop_calls_flag
-    stop_calls_flag = True
-    return {'status': 'success', 'message': 'Calls stopped'}
-
-# Flag to control call flow
-stop_calls_flag = False
-
-def make_calls(phone_numbers, delay, simultaneous_calls, use_custom_greeting, custom_greeting, 
-               playback_mode, mp3_selection, mp3_file, tts_provider, 
-               eleven_labs_voice, save_tts, client_sid):
-    """Make calls to the specified phone numbers with the specified settings."""
-    global stop_calls_flag
-    stop_calls_flag = False
+def handle_stop_calls(data=None):
+    """Handle stop calls request from client.
+
+    Stops the given campaign, or every active campaign of the logged-in user
+    when no campaign ID is sent.
+    """
+    data = data or {}
+    campaign_id = data.get('campaign_id')
+    hang_up = data.get('hang_up', True)
+    owner = session.get('username')
+    logger.info(f"Received stop_calls request for campaign {campaign_id or 'all of ' + str(owner)}, hang_up={hang_up}")
     
-    # Check if we're doing simultaneous calls to a single number
-    if len(phone_numbers) == 1 and simultaneous_calls > 1:
-        phone_number = phone_numbers[0].strip()
-        if not phone_number:
+    if campaign_id:
+        campaign = get_campaign(campaign_id)
+        if not campaign:
+            return {'status': 'error', 'message': f'Unknown campaign: {campaign_id}'}
+        stopping = [campaign]
+    else:
+        stopping = [c for c in list_campaigns() if c.owner == owner and c.is_active]
+    
+    for campaign in stopping:
+        stop_campaign(campaign, hang_up)
+    return {'status': 'success', 'message': f'Stopped {len(stopping)} campaign(s)'}
+
+def stop_campaign(campaign, hang_up=True):
+    """Stop a campaign and, with hang_up, end its live calls in the background."""
+    campaign.stop(hang_up=hang_up)
+    if hang_up:
+        Thread(target=hang_up_campaign_calls, args=(campaign,), daemon=True).start()
+
+class Campaign:
+    """A call campaign with its own settings, cancellation token, counters and worker handles."""
+
+    def __init__(self, phone_numbers, delay, simultaneous_calls, use_custom_greeting, custom_greeting,
+                 playback_mode, mp3_selection, mp3_file, tts_provider, eleven_labs_voice, save_tts,
+                 owner, options=None, campaign_id=None):
+        self.id = campaign_id or uuid.uuid4().hex[:12]
+        self.phone_numbers = phone_numbers
+        self.delay = delay
+        self.simultaneous_calls = simultaneous_calls
+        self.use_custom_greeting = use_custom_greeting
+        self.custom_greeting = custom_greeting
+        self.playback_mode = playback_mode
+        self.mp3_selection = mp3_selection
+        self.mp3_file = mp3_file
+        self.tts_provider = tts_provider
+        self.eleven_labs_voice = eleven_labs_voice
+        self.save_tts = save_tts
+        self.owner = owner
+        self.options = options or {'mode': 'standard'}
+        self.status = 'pending'
+        self.created_at = datetime.now()
+        self.cancelled = threading.Event()
+        self.counters = {'placed': 0, 'initiated': 0, 'failed': 0, 'completed': 0, 'suppressed': 0}
+        self.jobs = []
+        self.thread = None
+        self.hang_up_on_stop = False
+        self.load_stats_at = 0.0
+        self.queue_items = {}
+        self.audio_url = None
+        self.audio_pins = []
+        self.renderings = {}
+        self._plan_tokens = {}
+        self.breaker = CircuitBreaker(breaker_error_rate, breaker_window, breaker_cooldown)
+        self.adaptive = None
+        if self.options['mode'] == 'adaptive':
+            self.adaptive = AdaptiveConcurrency(
+                self.options['adaptive_initial'],
+                self.options['adaptive_max'],
+                self.options['adaptive_error_rate'],
+                self.options['adaptive_latency_ms'] / 1000,
+                window=adaptive_window
+            )
+        self._lock = threading.Lock()
+
+    @property
+    def stopped(self):
+        return self.cancelled.is_set()
+
+    @property
+    def is_active(self):
+        return self.status in ('pending', 'running')
+
+    def stop(self, hang_up=False):
+        """Cancel the campaign; its dispatch loop exits at the next check.
+
+        With hang_up, calls that are still being created when the campaign
+        stops are ended as soon as they exist.
+        """
+        logger.info(f"Stopping campaign {self.id}")
+        self.hang_up_on_stop = hang_up
+        self.cancelled.set()
+        if self.is_active:
+            self.status = 'stopping'
+            campaign_store.update_campaign(self)
+
+    def count(self, counter, amount=1):
+        with self._lock:
+            self.counters[counter] += amount
+
+    def track(self, job):
+        """Keep a handle on a queued call, dropping handles of finished ones."""
+        with self._lock:
+            if len(self.jobs) >= 256:
+                self.jobs = [j for j in self.jobs if not j.done()]
+            self.jobs.append(job)
+
+    @property
+    def room(self):
+        return campaign_room(self.owner)
+
+    def emit(self, event, data=None):
+        """Send an event for this campaign to the pages of the user who started it."""
+        data = dict(data or {}, campaign_id=self.id)
+        socketio.emit(event, data, room=self.room)
+
+    def observe_create(self, latency, error):
+        """Feed the outcome of a calls.create request to the circuit breaker and adaptive controller."""
+        # Permanent errors such as an invalid number say nothing about the API's health
+        state = self.breaker.record(error is None or not is_transient_error(error))
+        if state:
+            logger.warning(f"Circuit breaker for campaign {self.id} is now {state}")
+            self.emit('circuit_breaker', self.breaker.stats())
+        if self.adaptive:
+            self.adaptive.record_create(latency, error)
+
+    def hold_while_tripped(self):
+        """Block the dispatch loop while the circuit breaker is open; return the seconds paused."""
+        return self.breaker.wait(self.cancelled)
+
+    @property
+    def greeting(self):
+        """The custom greeting, or empty when the default greeting is used."""
+        return self.custom_greeting if self.use_custom_greeting and self.custom_greeting else ''
+
+    @property
+    def untemplated_greeting(self):
+        """The greeting for calls without a rendering: a template filled with its defaults alone."""
+        return render_greeting(self.greeting, {}) if is_greeting_template(self.greeting) else self.greeting
+
+    def prepare_audio(self):
+        """Synthesize the campaign's greeting once, before the first dial, if it needs synthesized audio.
+
+        If synthesis fails, calls fall back to Twilio text-to-speech.
+        """
+        if is_greeting_template(self.greeting) and self.prepare_rendered_greetings():
+            return
+        greeting = self.untemplated_greeting
+        if not needs_tts_synthesis(self.playback_mode, greeting, self.tts_provider):
             return
-            
-        logger.info(f"Making {simultaneous_calls} simultaneous calls to {phone_number}")
         
-        # Emit pending status for all simultaneous calls
-        for i in range(simultaneous_calls):
-            call_id = f"call_{i}_{int(time.time())}"
-            socketio.emit('call_status', {
-                'call_id': call_id,
-                'phone_number': f"{phone_number} (Call {i+1}/{simultaneous_calls})",
-                'status': 'pending',
-                'message': 'Preparing to call'
-            }, room=client_sid)
+        self.emit('campaign_prep', {'stage': 'synthesizing',
+                                    'message': f'Synthesizing the greeting with {tts_providers[self.tts_provider].label}'})
+        started = time.monotonic()
+        self.audio_url, provider = synthesize_greeting(greeting, self.eleven_labs_voice,
+                                                       self.id if self.save_tts else None,
+                                                       self.tts_provider, self.audio_pins)
+        elapsed = round(time.monotonic() - started, 2)
+        if self.audio_url:
+            label = tts_providers[provider].label
+            logger.info(f"Synthesized greeting for campaign {self.id} with {label} in {elapsed}s: {self.audio_url}")
+            message = f'Greeting synthesized with {label} in {elapsed}s'
+            if provider != self.tts_provider:
+                message += f' ({tts_providers[self.tts_provider].label} was too slow or failed)'
+            self.emit('campaign_prep', {'stage': 'ready', 'provider': provider, 'message': message})
+        else:
+            logger.warning(f"Greeting synthesis failed for campaign {self.id}; calls will use Twilio text-to-speech")
+            self.emit('campaign_prep', {'stage': 'failed', 'message': 'Greeting synthesis failed, using Twilio text-to-speech'})
+
+    def prepare_rendered_greetings(self):
+        """Fill the greeting template for every destination and synthesize the distinct renderings before the first dial.
+
+        Renderings are keyed by the values filled into the template, so
+        numbers with the same values share one rendering and one call plan;
+        each call looks its rendering up from its own row when it is dialed.
+        They are synthesized in a bounded parallel batch with progress
+        reported to the client, and those that fail use Twilio text-to-speech.
+
+        Returns False, with no renderings, when there are more than
+        GREETING_RENDERINGS_MAX distinct ones; every call then uses the
+        untemplated greeting.
+        """
+        rows = 0
+        for number, fields in self.greeting_rows():
+            rows += 1
+            values = greeting_values(self.greeting, dict(fields, phone_number=number))
+            if values not in self.renderings:
+                if len(self.renderings) >= greeting_renderings_max:
+                    logger.warning(f"Campaign {self.id} has more than {greeting_renderings_max} distinct greetings; "
+                                   f"calls will use the greeting without the list's fields")
+                    self.emit('campaign_prep', {'stage': 'failed',
+                                                'message': f'More than {greeting_renderings_max} distinct greetings, '
+                                                           f'using the greeting without the list\'s fields'})
+                    self.renderings.clear()
+                    return False
+                greeting = render_greeting(self.greeting, dict(fields, phone_number=number))
+                self.renderings[values] = {'greeting': greeting, 'audio_url': None}
+        total = len(self.renderings)
+        logger.info(f"Rendered the greeting template of campaign {self.id}: {total} distinct greetings "
+                    f"for {rows} numbers")
         
-        # Create threads for simultaneous calls
-        threads = []
-        for i in range(simultaneous_calls):
-            if stop_calls_flag:
-                logger.info("Stopping calls as requested")
-                break
-                
-            call_id = f"call_{i}_{int(time.time())}"
-            
-            # Create thread for this call
-            thread = Thread(target=make_single_call, args=(
-                phone_number,
-                call_id,
-                f"{phone_number} (Call {i+1}/{simultaneous_calls})",
-                use_custom_greeting,
-                custom_greeting,
-                playback_mode,
-                mp3_selection,
-                mp3_file,
-                tts_provider,
-                eleven_labs_voice,
-                save_tts,
-                client_sid
-            ))
-            thread.daemon = True
-            threads.append(thread)
-        
-        # Start all threads
-        for thread in threads:
-            thread.start()
-            time.sleep(0.2)  # Small delay to prevent rate limiting
-        
-        # Wait for all threads to complete
-        for thread in threads:
-            thread.join()
-            
-        # All calls completed
-        if not stop_calls_flag:
-            socketio.emit('all_calls_completed', room=client_sid)
-    else:
-        # Original behavior for multiple different numbers or just one call
-        for i, phone_number in enumerate(phone_numbers):
-            if stop_calls_flag:
-                logger.info("Stopping calls as requested")
-                break
-            
-            # Clean the phone number
-            phone_number = phone_number.strip()
-            if not phone_number:
+        if not total or not needs_tts_synthesis(self.playback_mode, self.greeting, self.tts_provider):
+            return True
+        
+        self.emit('campaign_prep', {'stage': 'synthesizing', 'done': 0, 'total': total,
+                                    'message': f'Synthesizing {total} greetings with {tts_providers[self.tts_provider].label}'})
+        started = time.monotonic()
+        last_report = started
+        done = failed = 0
+        providers = {}
+        with ThreadPoolExecutor(max_workers=min(tts_prerender_workers, total)) as pool:
+            futures = {pool.submit(synthesize_greeting, rendering['greeting'], self.eleven_labs_voice,
+                                   provider=self.tts_provider, pins=self.audio_pins): rendering
+                       for rendering in self.renderings.values()}
+            for future in as_completed(futures):
+                try:
+                    futures[future]['audio_url'], provider = future.result()
+                    if provider:
+                        providers[provider] = providers.get(provider, 0) + 1
+                except Exception as e:
+                    logger.error(f"Greeting synthesis failed for campaign {self.id}: {str(e)}")
+                done += 1
+                if not futures[future]['audio_url']:
+                    failed += 1
+                if self.stopped:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    break
+                if done < total and time.monotonic() - last_report < 0.5:
+                    continue
+                last_report = time.monotonic()
+                self.emit('campaign_prep', {'stage': 'synthesizing', 'done': done, 'total': total,
+                                            'message': f'Synthesized {done} of {total} greetings'})
+        
+        elapsed = round(time.monotonic() - started, 2)
+        by_provider = ', '.join(f'{count} with {tts_providers[name].label}' for name, count in providers.items())
+        logger.info(f"Synthesized {done - failed} of {total} greetings for campaign {self.id} in {elapsed}s"
+                    + (f" ({by_provider})" if by_provider else ''))
+        message = f'{done - failed} of {total} greetings synthesized in {elapsed}s'
+        if set(providers) - {self.tts_provider}:
+            message += f' ({by_provider})'
+        if failed or done < total:
+            message += ', the rest use Twilio text-to-speech'
+        self.emit('campaign_prep', {'stage': 'ready' if done - failed else 'failed', 'done': done, 'total': total,
+                                    'providers': providers, 'message': message})
+        return True
+
+    def greeting_rows(self):
+        """Iterate over the destination numbers with the list columns that fill a greeting template."""
+        if self.options.get('number_list'):
+            return NumberList(self.options['number_list']).rows()
+        return ((number, {}) for number in self.numbers())
+
+    def call_plan_token(self, mp3_file, phone_number=None, fields=None):
+        """Token of this campaign's call plan with the given MP3 for a number, registering the plan on first use.
+
+        The number's rendering is found from the list columns of its row in
+        fields. Numbers the template was not rendered for before dialing use
+        the untemplated greeting, so there is never a plan per number.
+        """
+        values = None
+        if self.renderings and phone_number is not None:
+            values = greeting_values(self.greeting, dict(fields or {}, phone_number=phone_number))
+            if values not in self.renderings:
+                values = None
+        token = self._plan_tokens.get((mp3_file, values))
+        if token is None:
+            if values is None:
+                plan = self.call_plan(mp3_file, self.untemplated_greeting, self.audio_url)
+            else:
+                rendering = self.renderings[values]
+                plan = self.call_plan(mp3_file, rendering['greeting'], rendering['audio_url'])
+            token = call_plans.register(plan, owner=self.id)
+            self._plan_tokens[(mp3_file, values)] = token
+        return token
+
+    def release_call_plans(self):
+        """Hand this campaign's call plans back to the store once it has finished or been stopped."""
+        self._plan_tokens.clear()
+        call_plans.release(self.id)
+
+    def release_audio(self):
+        """Unpin the synthesized greetings this campaign's calls play, letting the TTS cache evict them."""
+        while self.audio_pins:
+            tts_cache.unpin(self.audio_pins.pop())
+
+    def call_plan(self, mp3_file, greeting, audio_url):
+        return {
+            'playback_mode': self.playback_mode,
+            'greeting': greeting,
+            'mp3_file': mp3_file,
+            'tts_provider': self.tts_provider,
+            'audio_url': audio_url
+        }
+
+    def numbers(self):
+        """Iterate over the destination numbers, reading an uploaded list lazily from disk."""
+        if self.options.get('number_list'):
+            return iter(NumberList(self.options['number_list']))
+        return (n.strip() for n in self.phone_numbers if n.strip())
+
+    def cycle_rows(self):
+        """Yield the destination numbers with their list columns over and over, for modes that dial until stopped."""
+        while True:
+            empty = True
+            for row in self.greeting_rows():
+                empty = False
+                yield row
+            if empty:
+                return
+
+    @property
+    def number_count(self):
+        if self.options.get('number_list'):
+            return len(NumberList(self.options['number_list']))
+        return sum(1 for n in self.phone_numbers if n.strip())
+
+    @property
+    def dial_total(self):
+        """The length of a standard campaign's dial queue, or None for modes that do not use one."""
+        if self.options['mode'] != 'standard':
+            return None
+        count = self.number_count
+        if count == 1 and self.simultaneous_calls > 1:
+            return self.simultaneous_calls
+        return count
+
+    def mark_dispatched(self, call_id):
+        """Checkpoint a queued dial item as sent, just before its create request; other calls are ignored."""
+        with self._lock:
+            item = self.queue_items.get(call_id)
+        if item is not None:
+            campaign_store.mark_item(self.id, *item, 'dispatched')
+
+    def checkpoint_item(self, call_id, state, call_sid=None, error=None):
+        """Record the outcome of a queued dial item; calls that did not come from the queue are ignored."""
+        with self._lock:
+            item = self.queue_items.pop(call_id, None)
+        if item is not None:
+            campaign_store.mark_item(self.id, *item, state, call_sid, error)
+
+    def settings(self):
+        """The settings needed to rebuild this campaign, as stored in the campaign store."""
+        return {
+            'phone_numbers': self.phone_numbers,
+            'delay': self.delay,
+            'simultaneous_calls': self.simultaneous_calls,
+            'use_custom_greeting': self.use_custom_greeting,
+            'custom_greeting': self.custom_greeting,
+            'playback_mode': self.playback_mode,
+            'mp3_selection': self.mp3_selection,
+            'mp3_file': self.mp3_file,
+            'tts_provider': self.tts_provider,
+            'eleven_labs_voice': self.eleven_labs_voice,
+            'save_tts': self.save_tts,
+            'options': self.options
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        """Rebuild a campaign from its campaign store record."""
+        settings = record['settings']
+        campaign = cls(
+            settings['phone_numbers'],
+            settings['delay'],
+            settings['simultaneous_calls'],
+            settings['use_custom_greeting'],
+            settings['custom_greeting'],
+            settings['playback_mode'],
+            settings['mp3_selection'],
+            settings['mp3_file'],
+            settings['tts_provider'],
+            settings['eleven_labs_voice'],
+            settings['save_tts'],
+            record['owner'],
+            settings['options'],
+            campaign_id=record['id']
+        )
+        campaign.created_at = datetime.fromisoformat(record['created_at'])
+        campaign.counters.update(record['counters'])
+        return campaign
+
+    def to_dict(self):
+        with self._lock:
+            counters = dict(self.counters)
+            pending_jobs = sum(1 for j in self.jobs if not j.done())
+        return {
+            'campaign_id': self.id,
+            'owner': self.owner,
+            'mode': self.options['mode'],
+            'status': self.status,
+            'created_at': self.created_at.isoformat(),
+            'numbers': self.number_count,
+            'counters': counters,
+            'pending_jobs': pending_jobs,
+            'circuit_breaker': self.breaker.stats(),
+            'queue': campaign_store.progress(self.id),
+            'adaptive': self.adaptive.stats() if self.adaptive else None
+        }
+
+# Registry of campaigns by ID
+campaigns = {}
+campaigns_lock = threading.Lock()
+max_campaign_history = int(os.environ.get('CAMPAIGN_HISTORY', '100'))
+
+def register_campaign(campaign):
+    """Add a campaign to the registry, forgetting the oldest finished ones beyond the history limit."""
+    with campaigns_lock:
+        campaigns[campaign.id] = campaign
+        finished = [c for c in campaigns.values() if not c.is_active]
+        for old in sorted(finished, key=lambda c: c.created_at)[:max(0, len(finished) - max_campaign_history)]:
+            del campaigns[old.id]
+
+def get_campaign(campaign_id):
+    with campaigns_lock:
+        return campaigns.get(campaign_id)
+
+def list_campaigns():
+    with campaigns_lock:
+        return list(campaigns.values())
+
+class CampaignStore:
+    """SQLite (WAL) store of campaigns and the dial queues of list campaigns.
+
+    A list campaign's dial queue is the sequence of its numbers, so only its
+    length is stored up front. An item gets a row when it is dispatched, just
+    before its create request is sent, and moves to dialed or failed once
+    Twilio answers; items without a row are pending.
+    After a restart, dispatched items whose outcome was never recorded become
+    unknown rather than being dialed twice.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS campaigns (
+            id TEXT PRIMARY KEY,
+            owner TEXT,
+            dial_total INTEGER,
+            mode TEXT NOT NULL,
+            settings TEXT NOT NULL,
+            status TEXT NOT NULL,
+            counters TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS dial_items (
+            campaign_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            phone_number TEXT NOT NULL,
+            state TEXT NOT NULL,
+            call_sid TEXT,
+            error TEXT,
+            updated_at TEXT,
+            PRIMARY KEY (campaign_id, seq)
+        );
+        CREATE INDEX IF NOT EXISTS dial_items_state ON dial_items (campaign_id, state, seq);
+        CREATE TABLE IF NOT EXISTS call_plans (
+            token TEXT PRIMARY KEY,
+            plan TEXT NOT NULL,
+            twiml BLOB,
+            created_at TEXT NOT NULL
+        );
+    """
+
+    def __init__(self, path):
+        self.path = path
+        # One connection shared under a lock: SQLite serializes writers anyway,
+        # and it works the same with thread, gevent and asyncio dispatch
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(self.SCHEMA)
+        # Databases from before campaigns belonged to a user keyed them by Socket.IO session
+        columns = [row['name'] for row in self._db.execute("PRAGMA table_info(campaigns)")]
+        if 'owner' not in columns:
+            self._db.execute("ALTER TABLE campaigns ADD COLUMN owner TEXT")
+        # Older databases stored every dial item up front; keep their length and drop the rows not dialed yet
+        if 'dial_total' not in columns:
+            with self._db:
+                self._db.execute("ALTER TABLE campaigns ADD COLUMN dial_total INTEGER")
+                self._db.execute(
+                    "UPDATE campaigns SET dial_total = "
+                    "(SELECT COUNT(*) FROM dial_items WHERE campaign_id = campaigns.id) "
+                    "WHERE id IN (SELECT DISTINCT campaign_id FROM dial_items)"
+                )
+                self._db.execute("DELETE FROM dial_items WHERE state IN ('pending', 'claimed')")
+        self._lock = threading.Lock()
+
+    def add_campaign(self, campaign):
+        """Store a new campaign, with the length of its dial queue for list campaigns."""
+        now = datetime.now().isoformat()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO campaigns (id, owner, dial_total, mode, settings, status, counters, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (campaign.id, campaign.owner, campaign.dial_total, campaign.options['mode'],
+                 json.dumps(campaign.settings()), campaign.status, json.dumps(campaign.counters),
+                 campaign.created_at.isoformat(), now)
+            )
+
+    def update_campaign(self, campaign):
+        """Checkpoint a campaign's status and counters."""
+        with campaign._lock:
+            counters = json.dumps(campaign.counters)
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE campaigns SET status = ?, counters = ?, updated_at = ? WHERE id = ?",
+                (campaign.status, counters, datetime.now().isoformat(), campaign.id)
+            )
+
+    def done_items(self, campaign_id, start, stop):
+        """Return the sequence numbers in [start, stop) of a campaign's dial items that are no longer pending."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq FROM dial_items WHERE campaign_id = ? AND seq >= ? AND seq < ?", (campaign_id, start, stop)
+            ).fetchall()
+        return {row['seq'] for row in rows}
+
+    def mark_item(self, campaign_id, seq, phone_number, state, call_sid=None, error=None):
+        """Checkpoint a dial item; marking it pending again drops its row."""
+        with self._lock, self._db:
+            if state == 'pending':
+                self._db.execute("DELETE FROM dial_items WHERE campaign_id = ? AND seq = ?", (campaign_id, seq))
+                return
+            self._db.execute(
+                "INSERT INTO dial_items (campaign_id, seq, phone_number, state, call_sid, error, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (campaign_id, seq) DO UPDATE SET state = excluded.state, "
+                "call_sid = COALESCE(excluded.call_sid, call_sid), error = excluded.error, "
+                "updated_at = excluded.updated_at",
+                (campaign_id, seq, phone_number, state, call_sid, error, datetime.now().isoformat())
+            )
+
+    def progress(self, campaign_id):
+        """Count a campaign's dial items by state, or None if it has no dial queue."""
+        with self._lock:
+            campaign = self._db.execute("SELECT dial_total FROM campaigns WHERE id = ?", (campaign_id,)).fetchone()
+            if campaign is None or campaign['dial_total'] is None:
+                return None
+            rows = self._db.execute(
+                "SELECT state, COUNT(*) AS n FROM dial_items WHERE campaign_id = ? GROUP BY state", (campaign_id,)
+            ).fetchall()
+        counts = {row['state']: row['n'] for row in rows}
+        pending = campaign['dial_total'] - sum(counts.values())
+        if pending:
+            counts['pending'] = pending
+        return counts
+
+    def save_call_plan(self, token, plan, twiml=None):
+        """Store a call plan and, once rendered, its TwiML."""
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT INTO call_plans (token, plan, twiml, created_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (token) DO UPDATE SET twiml = COALESCE(excluded.twiml, twiml)",
+                (token, json.dumps(plan), twiml, datetime.now().isoformat())
+            )
+
+    def delete_call_plans(self, tokens):
+        with self._lock, self._db:
+            self._db.executemany("DELETE FROM call_plans WHERE token = ?", [(token,) for token in tokens])
+
+    def load_call_plan(self, token):
+        """Return a stored call plan and its TwiML (or None if not rendered yet), or None if the token is unknown."""
+        with self._lock:
+            row = self._db.execute("SELECT plan, twiml FROM call_plans WHERE token = ?", (token,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row['plan']), row['twiml']
+
+    def recover(self):
+        """Clean up after an unclean shutdown and return the records of campaigns to resume.
+
+        Only list campaigns with pending dial items can be resumed. Other
+        campaigns that were still running are marked interrupted, since their
+        load targets are tied to the time they were started.
+        """
+        now = datetime.now().isoformat()
+        resumable = []
+        with self._lock, self._db:
+            self._db.execute("UPDATE dial_items SET state = 'unknown', updated_at = ? WHERE state = 'dispatched'", (now,))
+            self._db.execute("UPDATE campaigns SET status = 'stopped', updated_at = ? WHERE status = 'stopping'", (now,))
+            rows = self._db.execute(
+                "SELECT * FROM campaigns WHERE status IN ('pending', 'running') ORDER BY created_at"
+            ).fetchall()
+            for row in rows:
+                done = self._db.execute(
+                    "SELECT COUNT(*) FROM dial_items WHERE campaign_id = ?", (row['id'],)
+                ).fetchone()[0]
+                if row['dial_total'] is None or done >= row['dial_total']:
+                    self._db.execute("UPDATE campaigns SET status = 'interrupted', updated_at = ? WHERE id = ?",
+                                     (now, row['id']))
+                    continue
+                resumable.append({
+                    'id': row['id'],
+                    # Campaigns recorded before they had an owner go to the admin user's pages
+                    'owner': row['owner'] or admin_username,
+                    'settings': json.loads(row['settings']),
+                    'counters': json.loads(row['counters']),
+                    'created_at': row['created_at']
+                })
+        return resumable
+
+campaign_store = CampaignStore(campaign_db_path)
+
+# Header names recognized as the phone number column of an uploaded CSV
+NUMBER_COLUMN_NAMES = {'phone', 'phone_number', 'phone number', 'phonenumber', 'number', 'to',
+                       'destination', 'mobile', 'msisdn', 'tel', 'telephone'}
+
+def normalize_e164(raw, country_code=None):
+    """Normalize a phone number to E.164 ('+' and 8 to 15 digits), or return None if it is not valid.
+
+    Numbers without a '+' or '00' international prefix are national numbers
+    in the default country, with a leading trunk '0' dropped.
+    """
+    raw = raw.strip()
+    if not raw or re.search(r'[A-Za-z]', raw):
+        return None
+    
+    digits = re.sub(r'\D', '', raw)
+    if not raw.startswith('+'):
+        country_code = country_code or default_country_code
+        if digits.startswith('00'):
+            digits = digits[2:]
+        elif country_code == '1' and len(digits) == 11 and digits.startswith('1'):
+            pass  # NANP number already written with its country code
+        else:
+            digits = country_code + (digits[1:] if digits.startswith('0') else digits)
+    
+    if not 8 <= len(digits) <= 15 or digits.startswith('0'):
+        return None
+    if digits.startswith('1') and len(digits) != 11:
+        return None
+    return '+' + digits
+
+def parse_number_rows(lines, stats):
+    """Yield the E.164 number and other columns of each row of a CSV or TXT upload, counting invalid rows in stats.
+
+    The phone column is the first header column with a recognized name, or
+    the first column when there is no header. The other columns come as a
+    dict keyed by their header names, lowercased with non-word characters
+    replaced by '_'; it is empty when there is no header.
+    """
+    column = None
+    names = []
+    for row in csv.reader(lines):
+        if not any(field.strip() for field in row):
+            continue
+        if column is None:
+            header = [field.strip().lower() for field in row]
+            named = [i for i, field in enumerate(header) if field in NUMBER_COLUMN_NAMES]
+            column = named[0] if named else 0
+            if named:
+                names = [(i, re.sub(r'\W+', '_', field).strip('_')) for i, field in enumerate(header) if i != column]
+                continue
+        
+        number = normalize_e164(row[column]) if column < len(row) else None
+        if number is None:
+            stats['invalid'] += 1
+            continue
+        yield number, {name: row[i].strip() for i, name in names if name and i < len(row)}
+
+def write_packed_numbers(path, keys):
+    """Write integer E.164 numbers to path as a packed array of native uint64, atomically."""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            chunk = array('Q')
+            for key in keys:
+                chunk.append(key)
+                if len(chunk) >= 65536:
+                    chunk.tofile(out)
+                    chunk = array('Q')
+            chunk.tofile(out)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def read_packed_numbers(path):
+    """Yield the integers of a packed uint64 file through a read-only memory map."""
+    if not os.path.exists(path) or not os.path.getsize(path):
+        return
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        numbers = memoryview(mm).cast('Q')
+        try:
+            yield from numbers
+        finally:
+            numbers.release()
+
+def import_number_list(lines, name=''):
+    """Stream the lines of a CSV or TXT upload into a new number list and return its metadata.
+
+    Rows are validated and de-duplicated as they arrive and written straight
+    to disk as packed integers, so only the numbers seen so far are held in
+    memory, as integers. Other CSV columns, used to fill greeting templates,
+    go to a <list_id>.vars.jsonl sidecar with one JSON object per number, in
+    the same order.
+    """
+    list_id = uuid.uuid4().hex[:12]
+    meta = {
+        'list_id': list_id,
+        'name': name,
+        'created_at': datetime.now().isoformat(),
+        'count': 0,
+        'duplicates': 0,
+        'invalid': 0,
+        'columns': []
+    }
+    seen = set()
+    vars_path = os.path.join(number_list_dir, f"{list_id}.vars.jsonl")
+    os.makedirs(number_list_dir, exist_ok=True)
+    fd, vars_tmp_path = tempfile.mkstemp(dir=number_list_dir, suffix='.tmp')
+    
+    def unique_keys(vars_file):
+        for number, fields in parse_number_rows(lines, meta):
+            key = int(number[1:])
+            if key in seen:
+                meta['duplicates'] += 1
+                continue
+            seen.add(key)
+            if not meta['count']:
+                meta['columns'] = list(fields)
+            meta['count'] += 1
+            if meta['columns']:
+                vars_file.write(json.dumps(fields) + '\n')
+            yield key
+    
+    try:
+        with os.fdopen(fd, 'w') as vars_file:
+            write_packed_numbers(os.path.join(number_list_dir, f"{list_id}.u64"), unique_keys(vars_file))
+        if meta['columns']:
+            os.replace(vars_tmp_path, vars_path)
+    finally:
+        if os.path.exists(vars_tmp_path):
+            os.remove(vars_tmp_path)
+    with open(os.path.join(number_list_dir, f"{list_id}.json"), 'w') as f:
+        json.dump(meta, f)
+    logger.info(f"Imported number list {list_id} ({name}): {meta['count']} numbers, "
+                f"{meta['duplicates']} duplicates and {meta['invalid']} invalid rows dropped")
+    return meta
+
+class NumberList:
+    """An uploaded number list stored as packed uint64 E.164 numbers, read lazily through a memory map."""
+
+    def __init__(self, list_id):
+        if not re.fullmatch(r'[0-9a-f]{12}', list_id or ''):
+            raise ValueError(f"Invalid number list ID: {list_id}")
+        self.list_id = list_id
+        self.path = os.path.join(number_list_dir, f"{list_id}.u64")
+        self.vars_path = os.path.join(number_list_dir, f"{list_id}.vars.jsonl")
+        try:
+            with open(os.path.join(number_list_dir, f"{list_id}.json")) as f:
+                self.meta = json.load(f)
+        except FileNotFoundError:
+            raise ValueError(f"Number list {list_id} does not exist")
+
+    def __len__(self):
+        return self.meta['count']
+
+    def __iter__(self):
+        for key in read_packed_numbers(self.path):
+            yield f"+{key}"
+
+    def rows(self):
+        """Yield each number with its other CSV columns, or an empty dict when the upload had none."""
+        if not os.path.exists(self.vars_path):
+            for number in self:
+                yield number, {}
+            return
+        with open(self.vars_path) as f:
+            for number, line in zip(self, f):
+                yield number, json.loads(line)
+
+def list_number_lists():
+    """Metadata of all uploaded number lists, newest first."""
+    lists = []
+    for path in glob.glob(os.path.join(number_list_dir, '*.json')):
+        with open(path) as f:
+            lists.append(json.load(f))
+    return sorted(lists, key=lambda m: m['created_at'], reverse=True)
+
+class SuppressionList:
+    """Do-not-call numbers as a sorted uint64 array in a memory-mapped file, checked by binary search.
+
+    Opening the list only maps the file, so loading and swapping in a new
+    list cost nothing however long it is.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._mmap = None
+        self._numbers = []
+        if os.path.exists(path) and os.path.getsize(path):
+            with open(path, 'rb') as f:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self._numbers = memoryview(self._mmap).cast('Q')
+
+    def __len__(self):
+        return len(self._numbers)
+
+    def __contains__(self, phone_number):
+        number = normalize_e164(phone_number)
+        if number is None:
+            return False
+        key = int(number[1:])
+        i = bisect.bisect_left(self._numbers, key)
+        return i < len(self._numbers) and self._numbers[i] == key
+
+    def stats(self):
+        return {'count': len(self), 'file_bytes': len(self) * 8}
+
+dnc_path = os.path.join(number_list_dir, 'dnc.u64')
+dnc_list = SuppressionList(dnc_path)
+dnc_lock = threading.Lock()
+
+# Numbers sorted in memory at a time when merging an upload into the do-not-call list
+DNC_SORT_CHUNK = 1_000_000
+
+def write_sorted_runs(keys, directory):
+    """Sort integers in chunks of DNC_SORT_CHUNK into temporary packed files and return their paths."""
+    paths = []
+    chunk = []
+    
+    def flush():
+        fd, path = tempfile.mkstemp(dir=directory, suffix='.run')
+        os.close(fd)
+        paths.append(path)
+        chunk.sort()
+        write_packed_numbers(path, chunk)
+        chunk.clear()
+    
+    try:
+        for key in keys:
+            chunk.append(key)
+            if len(chunk) >= DNC_SORT_CHUNK:
+                flush()
+        if chunk:
+            flush()
+    except BaseException:
+        for path in paths:
+            os.remove(path)
+        raise
+    return paths
+
+def unique_sorted(keys):
+    """Drop repeats from sorted integers."""
+    last = None
+    for key in keys:
+        if key != last:
+            yield key
+            last = key
+
+def update_dnc_list(lines, replace=False):
+    """Add the numbers in an uploaded CSV or TXT file to the do-not-call list, or replace it; return the result.
+
+    The upload is sorted in bounded chunks and merged with the current list
+    file as a stream, so neither list is ever held in memory as a whole.
+    """
+    global dnc_list
+    result = {'invalid': 0}
+    with dnc_lock:
+        before = 0 if replace else len(dnc_list)
+        os.makedirs(number_list_dir, exist_ok=True)
+        runs = write_sorted_runs((int(number[1:]) for number, _ in parse_number_rows(lines, result)), number_list_dir)
+        try:
+            sources = [read_packed_numbers(path) for path in runs]
+            if not replace:
+                sources.append(read_packed_numbers(dnc_path))
+            write_packed_numbers(dnc_path, unique_sorted(heapq.merge(*sources)))
+        finally:
+            for path in runs:
+                os.remove(path)
+        # Calls in flight keep using the old list until the swap
+        dnc_list = SuppressionList(dnc_path)
+    result['added'] = len(dnc_list) - before
+    result.update(dnc_list.stats())
+    logger.info(f"Updated do-not-call list: {result}")
+    return result
+
+def standard_dial_items(campaign):
+    """Iterate over the numbers a standard campaign dials, with their list columns, in order.
+
+    A single number is repeated for simultaneous calls.
+    """
+    if campaign.number_count == 1 and campaign.simultaneous_calls > 1:
+        return repeat(next(campaign.greeting_rows()), campaign.simultaneous_calls)
+    return campaign.greeting_rows()
+
+def pending_dial_items(campaign):
+    """Yield a campaign's pending dial items as (seq, phone_number, fields), looking up one batch at a time.
+
+    Items are read from the campaign's number list in order, skipping those
+    already in the campaign store, so a resumed campaign does not dial them twice.
+    """
+    items = enumerate(standard_dial_items(campaign))
+    while not campaign.stopped:
+        batch = list(islice(items, queue_batch_size))
+        if not batch:
+            return
+        campaign_store.update_campaign(campaign)
+        done = campaign_store.done_items(campaign.id, batch[0][0], batch[-1][0] + 1)
+        yield from ((seq, number, fields) for seq, (number, fields) in batch if seq not in done)
+
+def start_campaign(campaign):
+    """Run a campaign on its own thread."""
+    campaign.thread = Thread(target=make_calls, args=(campaign,))
+    campaign.thread.daemon = True
+    campaign.thread.start()
+    logger.info(f"Call thread started successfully")
+
+def resume_campaigns():
+    """Resume the list campaigns that were running when the server last stopped."""
+    for record in campaign_store.recover():
+        campaign = Campaign.from_record(record)
+        register_campaign(campaign)
+        logger.info(f"Resuming campaign {campaign.id}: {campaign_store.progress(campaign.id)}")
+        start_campaign(campaign)
+
+class DispatchJob:
+    """A unit of work queued on the call dispatcher."""
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def run(self):
+        """Run the job, capturing its result or error."""
+        try:
+            self.result = self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.error = e
+            logger.error(f"Dispatch job {self.fn.__name__} failed: {str(e)}", exc_info=True)
+        finally:
+            self._done.set()
+
+    async def run_async(self):
+        """Run a coroutine job on the asyncio dispatcher's event loop."""
+        try:
+            self.result = await self.fn(*self.args, **self.kwargs)
+        except Exception as e:
+            self.error = e
+            logger.error(f"Dispatch job {self.fn.__name__} failed: {str(e)}", exc_info=True)
+        finally:
+            self._done.set()
+
+    def done(self):
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished. Returns False on timeout."""
+        return self._done.wait(timeout)
+
+class CallDispatcher:
+    """Fixed-size worker pool that runs call jobs from a shared submission queue."""
+
+    ENGINES = ('thread', 'gevent')
+
+    def __init__(self, engine='thread', workers=50):
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown dispatch engine: {engine}")
+        self.engine = engine
+        self.workers = max(1, workers)
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._busy = 0
+        self._submitted = 0
+        self._completed = 0
+        self._started = False
+        self._warm_connections = 0
+        self._warmed_at = 0.0
+
+    def _start_workers(self):
+        """Start the worker pool on first use."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        
+        # Let every worker keep its own connection to Twilio alive instead of the default pool of 10
+        client.http_client.session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=self.workers))
+        
+        for i in range(self.workers):
+            if self.engine == 'gevent':
+                gevent.spawn(self._worker)
+            else:
+                Thread(target=self._worker, name=f"call-worker-{i}", daemon=True).start()
+        logger.info(f"Started {self.workers} {self.engine} dispatch workers")
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                self._busy += 1
+            try:
+                job.run()
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    self._completed += 1
+
+    def submit(self, fn, *args, **kwargs):
+        """Queue fn(*args, **kwargs) for a worker and return its DispatchJob."""
+        self._start_workers()
+        job = DispatchJob(fn, args, kwargs)
+        with self._lock:
+            self._submitted += 1
+        self._queue.put(job)
+        return job
+
+    def prepare(self, connections):
+        """Pre-open up to `connections` keep-alive connections to Twilio before a campaign starts."""
+        self._start_workers()
+        connections = min(connections, self.workers)
+        if connections <= self._warm_connections and time.monotonic() - self._warmed_at < dispatch_keepalive / 2:
+            return
+        
+        # Fetching the account is cheap; running the fetches side by side opens one connection each.
+        # They run on their own short-lived pool so they don't wait behind calls already on the queue.
+        started = time.monotonic()
+        account = client.api.v2010.accounts(account_sid)
+        with ThreadPoolExecutor(max_workers=connections, thread_name_prefix='twilio-warm-up') as pool:
+            futures = [pool.submit(account.fetch) for _ in range(connections)]
+            opened = 0
+            for future in futures:
+                try:
+                    future.result(timeout=30)
+                    opened += 1
+                except Exception as e:
+                    logger.debug(f"Warm-up request failed: {str(e)}")
+        if opened < connections:
+            logger.warning(f"{connections - opened} of {connections} warm-up requests failed")
+        self._warm_connections = opened
+        self._warmed_at = time.monotonic()
+        logger.info(f"Warmed {opened} Twilio connections in {self._warmed_at - started:.2f}s")
+
+    def stats(self):
+        """Return queue depth and worker utilization."""
+        with self._lock:
+            busy = self._busy
+            submitted = self._submitted
+            completed = self._completed
+        return {
+            'engine': self.engine,
+            'workers': self.workers,
+            'busy_workers': busy,
+            'idle_workers': self.workers - busy,
+            'queue_depth': self._queue.qsize(),
+            'utilization': round(busy / self.workers, 3),
+            'submitted': submitted,
+            'completed': completed
+        }
+
+class AsyncCallDispatcher:
+    """Runs call jobs as coroutines on a background asyncio loop with a pooled, keep-alive Twilio client."""
+
+    engine = 'asyncio'
+
+    def __init__(self, workers=50):
+        self.workers = max(1, workers)
+        self.client = None
+        self._loop = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._busy = 0
+        self._submitted = 0
+        self._completed = 0
+        self._warm_connections = 0
+        self._warmed_at = 0.0
+
+    def _start_loop(self):
+        """Start the event loop thread and the pooled Twilio client on first use."""
+        with self._lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+        
+        Thread(target=self._loop.run_forever, name="call-dispatch-loop", daemon=True).start()
+        asyncio.run_coroutine_threadsafe(self._create_client(), self._loop).result()
+        logger.info(f"Started asyncio dispatch loop with {self.workers} concurrent requests")
+
+    async def _create_client(self):
+        # The aiohttp session must be created on the loop that will use it
+        http_client = AsyncTwilioHttpClient(pool_connections=False)
+        http_client.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.workers, keepalive_timeout=dispatch_keepalive)
+        )
+        self.client = Client(account_sid, auth_token, http_client=http_client)
+        self._semaphore = asyncio.Semaphore(self.workers)
+
+    async def _run(self, job):
+        with self._lock:
+            self._waiting += 1
+        async with self._semaphore:
+            with self._lock:
+                self._waiting -= 1
+                self._busy += 1
+            try:
+                if asyncio.iscoroutinefunction(job.fn):
+                    await job.run_async()
+                else:
+                    await self._loop.run_in_executor(None, job.run)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+                    self._completed += 1
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs) on the loop and return its DispatchJob."""
+        self._start_loop()
+        job = DispatchJob(fn, args, kwargs)
+        with self._lock:
+            self._submitted += 1
+        asyncio.run_coroutine_threadsafe(self._run(job), self._loop)
+        return job
+
+    async def _warm_up(self, connections):
+        # Fetching the account is cheap and leaves one keep-alive connection per request in the pool.
+        # The fetches run on the loop directly, not through _run, so they don't wait behind queued calls.
+        account = self.client.api.v2010.accounts(account_sid)
+        results = await asyncio.gather(*[account.fetch_async() for _ in range(connections)],
+                                       return_exceptions=True)
+        failures = [r for r in results if isinstance(r, Exception)]
+        if failures:
+            logger.warning(f"{len(failures)} of {connections} warm-up requests failed: {str(failures[0])}")
+        return connections - len(failures)
+
+    def prepare(self, connections):
+        """Pre-open up to `connections` pooled connections to Twilio before a campaign starts."""
+        self._start_loop()
+        connections = min(connections, self.workers)
+        if connections <= self._warm_connections and time.monotonic() - self._warmed_at < dispatch_keepalive / 2:
+            return
+        
+        started = time.monotonic()
+        try:
+            opened = asyncio.run_coroutine_threadsafe(self._warm_up(connections), self._loop).result(timeout=30)
+            self._warm_connections = opened
+            self._warmed_at = time.monotonic()
+            logger.info(f"Warmed {opened} Twilio connections in {time.monotonic() - started:.2f}s")
+        except Exception as e:
+            logger.error(f"Failed to warm Twilio connection pool: {str(e)}")
+
+    def stats(self):
+        """Return queue depth and in-flight request utilization."""
+        with self._lock:
+            return {
+                'engine': self.engine,
+                'workers': self.workers,
+                'busy_workers': self._busy,
+                'idle_workers': self.workers - self._busy,
+                'queue_depth': self._waiting,
+                'utilization': round(self._busy / self.workers, 3),
+                'submitted': self._submitted,
+                'completed': self._completed
+            }
+
+class LiveCallSlots:
+    """Counts a campaign's live calls and wakes its dispatcher when one ends."""
+
+    def __init__(self):
+        self.live = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, target, timeout=None):
+        """Take a slot once fewer than `target` calls are live. Returns False on timeout."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.live < target, timeout):
+                return False
+            self.live += 1
+            return True
+
+    def release(self):
+        """Free the slot held by a call that reached a terminal state."""
+        with self._cond:
+            self.live = max(0, self.live - 1)
+            self._cond.notify_all()
+
+    def wait_empty(self, timeout=None):
+        """Wait until no calls are live. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.live == 0, timeout)
+
+class DestinationScheduler:
+    """Hands out destinations round-robin under per-destination and global live-call caps.
+
+    Each destination has a number of calls left to place. A destination at
+    its cap is skipped rather than waited on, so one slow number never
+    holds up the rest of the list.
+    """
+
+    def __init__(self, numbers, calls_per_destination, per_destination_cap, global_cap):
+        self.per_destination_cap = per_destination_cap
+        self.global_cap = global_cap
+        self.remaining = {}
+        for number in numbers:
+            self.remaining[number] = self.remaining.get(number, 0) + calls_per_destination
+        self.live = {number: 0 for number in self.remaining}
+        self.total_live = 0
+        self._order = deque(self.remaining)
+        self._cond = threading.Condition()
+
+    def _pick(self):
+        if self.total_live >= self.global_cap:
+            return None
+        for _ in range(len(self._order)):
+            number = self._order[0]
+            self._order.rotate(-1)
+            if self.live[number] < self.per_destination_cap:
+                return number
+        return None
+
+    def acquire(self, timeout=None):
+        """Take a live-call slot on the next eligible destination, or None on timeout or when exhausted."""
+        with self._cond:
+            number = None
+            
+            def ready():
+                nonlocal number
+                number = self._pick()
+                return number is not None or not self._order
+            
+            if not self._cond.wait_for(ready, timeout) or number is None:
+                return None
+            
+            self.live[number] += 1
+            self.total_live += 1
+            self.remaining[number] -= 1
+            if self.remaining[number] == 0:
+                self._order.remove(number)
+            return number
+
+    def release(self, number):
+        """Free the slot held by a finished call to `number`."""
+        with self._cond:
+            self.live[number] = max(0, self.live[number] - 1)
+            self.total_live = max(0, self.total_live - 1)
+            self._cond.notify_all()
+
+    @property
+    def exhausted(self):
+        with self._cond:
+            return not self._order
+
+    def wait_empty(self, timeout=None):
+        """Wait until no calls are live. Returns False on timeout."""
+        with self._cond:
+            return self._cond.wait_for(lambda: self.total_live == 0, timeout)
+
+class BurstGate:
+    """Parks the calls of a burst until every one is ready, then releases them together."""
+
+    def __init__(self, parties, loop=None):
+        self.parties = parties
+        self.loop = loop
+        self.released_at = None
+        self._ready = 0
+        self._lock = threading.Lock()
+        self._all_ready = threading.Event()
+        self._release = threading.Event()
+        self._async_release = asyncio.Event()
+
+    def _arrive(self):
+        with self._lock:
+            self._ready += 1
+            if self._ready == self.parties:
+                self._all_ready.set()
+
+    def wait(self, timeout=None):
+        """Park a worker thread until release. Returns False on timeout."""
+        self._arrive()
+        return self._release.wait(timeout)
+
+    async def wait_async(self, timeout=None):
+        """Park a coroutine until release. Returns False on timeout."""
+        self._arrive()
+        try:
+            await asyncio.wait_for(self._async_release.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def wait_ready(self, timeout=None):
+        """Wait until every party is parked. Returns False on timeout."""
+        return self._all_ready.wait(timeout)
+
+    def release(self):
+        self.released_at = time.time()
+        self._release.set()
+        if self.loop:
+            self.loop.call_soon_threadsafe(self._async_release.set)
+
+# Shared dispatcher used by every campaign
+if dispatch_engine == 'asyncio':
+    dispatcher = AsyncCallDispatcher(dispatch_workers)
+else:
+    dispatcher = CallDispatcher(dispatch_engine, dispatch_workers)
+
+class TokenBucket:
+    """Thread- and greenlet-safe token bucket for pacing API requests."""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self._granted = 0
+        self._waited = 0.0
+
+    def reserve(self, tokens=1):
+        """Take tokens from the bucket and return how long the caller must wait before using them.
+
+        The balance may go negative, so concurrent callers queue up behind each
+        other and the long-run rate never exceeds the configured CPS.
+        """
+        if self.rate <= 0:
+            return 0.0
+        
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            wait = max(0.0, -self._tokens / self.rate)
+            self._granted += tokens
+            self._waited += wait
+        return wait
+
+    def acquire(self, tokens=1):
+        """Block until tokens are available."""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rate': self.rate,
+                'burst': self.burst,
+                'tokens': round(self._tokens, 3),
+                'granted': self._granted,
+                'total_wait_seconds': round(self._waited, 3)
+            }
+
+# Every call creation acquires from this limiter, across all campaigns
+call_rate_limiter = TokenBucket(twilio_cps, twilio_cps_burst)
+
+class CircuitBreaker:
+    """Pauses a campaign's dispatch while call creation keeps failing.
+
+    The breaker opens when the share of failures among the last `window`
+    create attempts reaches `threshold`. After `cooldown` seconds it lets
+    requests through again (half-open): the next success closes it and the
+    next failure opens it for another cooldown.
+    """
+
+    def __init__(self, threshold, window, cooldown):
+        self.threshold = threshold
+        self.window = max(1, window)
+        self.cooldown = cooldown
+        self._results = deque(maxlen=self.window)
+        self._opened_at = None
+        self._lock = threading.Lock()
+        self._trips = 0
+
+    def _state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at < self.cooldown:
+            return 'open'
+        return 'half-open'
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state()
+
+    def remaining(self):
+        """Seconds until requests may go through again, 0 unless the breaker is open."""
+        with self._lock:
+            if self._state() != 'open':
+                return 0.0
+            return max(0.0, self._opened_at + self.cooldown - time.monotonic())
+
+    def record(self, ok):
+        """Record one create attempt and return the new state if it changed, otherwise None."""
+        if self.threshold <= 0:
+            return None
+        
+        with self._lock:
+            state = self._state()
+            if state == 'open':
+                # Requests already in flight when the breaker opened
+                return None
+            if state == 'half-open':
+                if ok:
+                    self._opened_at = None
+                    self._results.clear()
+                    return 'closed'
+                self._trip()
+                return 'open'
+            
+            self._results.append(ok)
+            failures = sum(1 for r in self._results if not r)
+            if len(self._results) == self.window and failures / self.window >= self.threshold:
+                self._trip()
+                return 'open'
+        return None
+
+    def _trip(self):
+        self._opened_at = time.monotonic()
+        self._results.clear()
+        self._trips += 1
+
+    def wait(self, cancelled):
+        """Block until requests may go through or cancelled is set; return the seconds waited."""
+        started = time.monotonic()
+        while not cancelled.is_set():
+            remaining = self.remaining()
+            if remaining <= 0:
+                break
+            cancelled.wait(remaining)
+        return time.monotonic() - started
+
+    def stats(self):
+        with self._lock:
+            state = self._state()
+            return {
+                'state': state,
+                'reopens_in': round(max(0.0, self._opened_at + self.cooldown - time.monotonic()), 1) if state == 'open' else 0,
+                'recent_failures': sum(1 for r in self._results if not r),
+                'recent_attempts': len(self._results),
+                'trips': self._trips
+            }
+
+def is_transient_error(error):
+    """Whether a call-creation error says the API is unhealthy: throttling, server errors and connection problems."""
+    if isinstance(error, TwilioRestException):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                              aiohttp.ClientError, asyncio.TimeoutError))
+
+def is_retryable_error(error):
+    """Whether a failed call creation can be retried without risking a duplicate call.
+
+    calls.create is not idempotent, so only failures known to happen before
+    Twilio accepted the request are retried: throttling (429) and failures
+    to connect. A read timeout or a server error may come after the call was
+    created. The Twilio exception doesn't carry response headers, so a 503's
+    Retry-After can't be seen and 503s aren't retried either.
+    """
+    if isinstance(error, TwilioRestException):
+        return error.status == 429
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        return isinstance(reason, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError))
+    return isinstance(error, aiohttp.ClientConnectorError)
+
+def retry_delay(campaign, error, attempt):
+    """Seconds to wait before retrying a failed call creation, or None to give up.
+
+    The backoff uses full jitter, so calls that failed together do not retry
+    together, and never ends before the campaign's circuit breaker reopens.
+    """
+    if campaign.stopped or attempt >= create_retries or not is_retryable_error(error):
+        return None
+    backoff = random.uniform(0, min(create_retry_max, create_retry_base * 2 ** attempt))
+    return max(backoff, campaign.breaker.remaining())
+
+class AdaptiveConcurrency:
+    """AIMD controller for the live-call limit of an adaptive campaign.
+
+    Outcomes are judged in windows: a healthy window raises the limit by one
+    call, while a window whose error rate or p90 create latency is over its
+    threshold halves it. A throttled (429) request halves it at once. Each
+    change starts a new window, so one bad patch is only punished once.
+    """
+
+    def __init__(self, initial, maximum, error_threshold, latency_threshold, minimum=1, window=20):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.error_threshold = error_threshold
+        self.latency_threshold = latency_threshold
+        self.window = max(1, window)
+        self._outcomes = []
+        self._latencies = []
+        self._lock = threading.Lock()
+        self._increases = 0
+        self._decreases = 0
+        self._last_reason = None
+        self._last_error_rate = 0.0
+        self._last_p90 = 0.0
+
+    @property
+    def current(self):
+        """The limit as a whole number of live calls."""
+        return int(self.limit)
+
+    def record_create(self, latency, error=None):
+        """Record one calls.create request and how long the API took to answer it."""
+        throttled = isinstance(error, TwilioRestException) and error.status == 429
+        with self._lock:
+            self._latencies.append(latency)
+            self._outcomes.append(error is None)
+            if throttled:
+                self._decrease('throttled (429)')
+            else:
+                self._evaluate()
+
+    def record_status(self, call_status):
+        """Record the terminal status of a call; canceled calls were ended by us and are ignored."""
+        if call_status == 'canceled':
+            return
+        with self._lock:
+            self._outcomes.append(call_status == 'completed')
+            self._evaluate()
+
+    def _evaluate(self):
+        if len(self._outcomes) < self.window:
+            return
+        error_rate = 1 - sum(self._outcomes) / len(self._outcomes)
+        latencies = sorted(self._latencies)
+        p90 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))] if latencies else 0.0
+        self._last_error_rate = error_rate
+        self._last_p90 = p90
+        if error_rate > self.error_threshold:
+            self._decrease(f"error rate {error_rate:.0%}")
+        elif self.latency_threshold and p90 > self.latency_threshold:
+            self._decrease(f"p90 create latency {p90 * 1000:.0f} ms")
+        else:
+            self._increase()
+
+    def _increase(self):
+        self.limit = min(self.maximum, self.limit + 1)
+        self._increases += 1
+        self._reset()
+
+    def _decrease(self, reason):
+        self.limit = max(self.minimum, self.limit / 2)
+        self._decreases += 1
+        self._last_reason = reason
+        logger.info(f"Adaptive limit cut to {self.current} live calls: {reason}")
+        self._reset()
+
+    def _reset(self):
+        self._outcomes = []
+        self._latencies = []
+
+    def stats(self):
+        with self._lock:
+            return {
+                'limit': self.current,
+                'minimum': self.minimum,
+                'maximum': self.maximum,
+                'error_rate': round(self._last_error_rate, 3),
+                'p90_latency_ms': round(self._last_p90 * 1000),
+                'increases': self._increases,
+                'decreases': self._decreases,
+                'last_decrease_reason': self._last_reason
+            }
+
+def create_call(observer=None, cancelled=None, on_send=None, **kwargs):
+    """Create a Twilio call once the calls-per-second limiter allows it.
+
+    observer, if given, is called with the API latency and the error (or
+    None) of the request, not counting time spent waiting on the limiter.
+    on_send, if given, is called right before the request is sent. Returns
+    None without creating the call if the cancelled event was set by then.
+    """
+    call_rate_limiter.acquire()
+    if cancelled is not None and cancelled.is_set():
+        return None
+    if on_send:
+        on_send()
+    started = time.monotonic()
+    try:
+        call = client.calls.create(**kwargs)
+    except Exception as e:
+        if observer:
+            observer(time.monotonic() - started, e)
+        raise
+    if observer:
+        observer(time.monotonic() - started, None)
+    return call
+
+async def create_call_async(observer=None, cancelled=None, on_send=None, **kwargs):
+    """Create a Twilio call on the asyncio dispatcher once the calls-per-second limiter allows it."""
+    wait = call_rate_limiter.reserve()
+    if wait > 0:
+        await asyncio.sleep(wait)
+    if cancelled is not None and cancelled.is_set():
+        return None
+    if on_send:
+        on_send()
+    started = time.monotonic()
+    try:
+        call = await dispatcher.client.calls.create_async(**kwargs)
+    except Exception as e:
+        if observer:
+            observer(time.monotonic() - started, e)
+        raise
+    if observer:
+        observer(time.monotonic() - started, None)
+    return call
+
+# Hang-up requests share their own limiter and pool so they never wait behind queued calls
+hangup_rate_limiter = TokenBucket(hangup_rps, hangup_rps)
+hangup_executor = ThreadPoolExecutor(max_workers=hangup_concurrency, thread_name_prefix='hangup')
+
+def hang_up_call(call_sid):
+    """End one live call, whether it is queued, ringing or in progress. Returns True once the call is over."""
+    # 'canceled' has no effect on a call that was answered, so a lost 'answered' callback would leave it live;
+    # 'completed' ends calls in every state
+    hangup_rate_limiter.acquire()
+    try:
+        client.calls(call_sid).update(status='completed')
+        logger.info(f"Hung up call {call_sid}")
+        return True
+    except TwilioRestException as e:
+        # 21220: the call is no longer in a state that can be updated, i.e. it already ended
+        if e.code == 21220:
+            return True
+        error = e
+    except Exception as e:
+        error = e
+    
+    logger.error(f"Failed to hang up call {call_sid}: {str(error)}")
+    return False
+
+def hang_up_campaign_calls(campaign):
+    """End all of a campaign's live calls with concurrent, rate-limited update requests."""
+    call_sids = [sid for sid, info in list(calls.items())
+                 if info.get('campaign_id') == campaign.id and info['status'] not in TERMINAL_CALL_STATUSES]
+    total = len(call_sids)
+    logger.info(f"Hanging up {total} live calls for campaign {campaign.id}")
+    
+    started = time.monotonic()
+    ended = failed = 0
+    last_report = 0.0
+    futures = [hangup_executor.submit(hang_up_call, sid) for sid in call_sids]
+    for future in as_completed(futures):
+        if future.result():
+            ended += 1
+        else:
+            failed += 1
+        
+        now = time.monotonic()
+        if now - last_report >= 0.5 or ended + failed == total:
+            last_report = now
+            campaign.emit('hangup_progress', {
+                'total': total,
+                'ended': ended,
+                'failed': failed,
+                'elapsed': round(now - started, 2)
+            })
+    
+    if not total:
+        campaign.emit('hangup_progress', {'total': 0, 'ended': 0, 'failed': 0, 'elapsed': 0})
+    logger.info(f"Hung up {ended}/{total} calls for campaign {campaign.id} in {time.monotonic() - started:.2f}s ({failed} failed)")
+
+def make_calls(campaign):
+    """Run a campaign in the calling thread according to its mode."""
+    campaign.status = 'running'
+    campaign_store.update_campaign(campaign)
+    try:
+        campaign.prepare_audio()
+        mode = campaign.options['mode']
+        if mode in ('soak', 'adaptive'):
+            run_soak_campaign(campaign)
+        elif mode == 'arrival':
+            run_arrival_campaign(campaign)
+        elif mode == 'parallel':
+            run_parallel_campaign(campaign)
+        elif mode == 'burst':
+            run_burst_campaign(campaign)
+        else:
+            run_standard_campaign(campaign)
+        campaign.status = 'stopped' if campaign.stopped else 'completed'
+    except Exception as e:
+        logger.error(f"Campaign {campaign.id} failed: {str(e)}", exc_info=True)
+        campaign.status = 'failed'
+    campaign_store.update_campaign(campaign)
+    campaign.release_call_plans()
+    campaign.release_audio()
+    logger.info(f"Campaign {campaign.id} {campaign.status}: {campaign.counters}")
+
+def run_standard_campaign(campaign):
+    """Dial the list once, either as simultaneous calls to one number or one number after another.
+
+    Numbers are read from the campaign's dial queue in batches, so a
+    campaign resumed after a restart carries on with the first number not
+    yet dialed.
+    """
+    simultaneous_calls = campaign.simultaneous_calls
+    
+    # Check if we're doing simultaneous calls to a single number
+    if campaign.number_count == 1 and simultaneous_calls > 1:
+        logger.info(f"Making {simultaneous_calls} simultaneous calls to {next(campaign.numbers())}")
+        
+        # Open connections ahead of time, then queue the calls; the worker pool bounds concurrency
+        dispatcher.prepare(simultaneous_calls)
+        jobs = []
+        for seq, phone_number, fields in pending_dial_items(campaign):
+            campaign.hold_while_tripped()
+            if campaign.stopped:
+                logger.info("Stopping calls as requested")
+                break
+            
+            call_id = f"call_{seq}_{int(time.time())}"
+            display_number = f"{phone_number} (Call {seq+1}/{simultaneous_calls})"
+            campaign.emit('call_status', {
+                'call_id': call_id,
+                'phone_number': display_number,
+                'status': 'pending',
+                'message': 'Preparing to call'
+            })
+            jobs.append(dispatch_call(campaign, phone_number, call_id, display_number, queue_item=seq, fields=fields))
+        
+        # Wait for all queued calls to complete
+        for job in jobs:
+            job.wait()
+        logger.info(f"Dispatcher stats: {dispatcher.stats()}")
+    else:
+        # Original behavior for multiple different numbers or just one call
+        dispatcher.prepare(1)
+        first = True
+        for seq, phone_number, fields in pending_dial_items(campaign):
+            # Wait for the specified delay between calls
+            if not first:
+                campaign.cancelled.wait(campaign.delay)
+            first = False
+            
+            campaign.hold_while_tripped()
+            if campaign.stopped:
+                logger.info("Stopping calls as requested")
+                break
+            
+            # Generate a unique call ID
+            call_id = f"call_{seq}_{int(time.time())}"
+            
+            # Emit pending status
+            campaign.emit('call_status', {
+                'call_id': call_id,
+                'phone_number': phone_number,
+                'status': 'pending',
+                'message': 'Preparing to call'
+            })
+            
+            # Make the single call on a dispatcher worker
+            dispatch_call(campaign, phone_number, call_id, phone_number, queue_item=seq, fields=fields).wait()
+        
+    # All calls completed
+    if not campaign.stopped:
+        campaign.emit('all_calls_completed')
+
+# Seconds between live load updates sent to the client
+LOAD_STATS_INTERVAL = 1.0
+
+def emit_load_stats(campaign, stats, final=False):
+    """Send live load figures for a running campaign to the client, at most once per LOAD_STATS_INTERVAL.
+
+    The final figures of a campaign are always sent.
+    """
+    now = time.monotonic()
+    if not final and now - campaign.load_stats_at < LOAD_STATS_INTERVAL:
+        return
+    campaign.load_stats_at = now
+    try:
+        campaign.emit('load_stats', stats)
+    except Exception as e:
+        logger.error(f"Failed to emit load stats: {str(e)}")
+
+def run_soak_campaign(campaign):
+    """Hold a fixed number of live calls, replacing each one as soon as it ends.
+
+    Adaptive campaigns run the same loop with the target set by their AIMD
+    controller instead of a fixed number or profile.
+    """
+    options = campaign.options
+    if not campaign.number_count:
+        return
+    
+    # Numbers are read lazily with their list columns and dialed round-robin for as long as the campaign runs
+    destinations = campaign.cycle_rows()
+    
+    adaptive = campaign.adaptive
+    profile = options.get('load_profile')
+    duration = options['duration_minutes'] * 60
+    max_calls = options['max_calls']
+    if adaptive:
+        logger.info(f"Starting adaptive campaign: {adaptive.current} live calls to start, up to {adaptive.maximum}, "
+                    f"duration={duration}s, max_calls={max_calls or 'unlimited'}")
+    else:
+        logger.info(f"Starting soak campaign: {profile['shape'] + ' profile' if profile else options['soak_target']} live calls, "
+                    f"duration={duration}s, max_calls={max_calls or 'unlimited'}")
+    
+    def target_at(elapsed):
+        """Live-call target at the given campaign time."""
+        if adaptive:
+            return adaptive.current
+        if profile:
+            return min(int(round(profile_value(profile, elapsed))), max_simultaneous_calls)
+        return options['soak_target']
+    
+    slots = LiveCallSlots()
+    started = time.monotonic()
+    deadline = started + duration if duration else None
+    placed = 0
+    
+    def report(final=False):
+        elapsed = time.monotonic() - started
+        stats = {
+            'mode': options['mode'],
+            'unit': 'live calls',
+            'target': target_at(elapsed),
+            'achieved': slots.live,
+            'live': slots.live,
+            'placed': placed,
+            'elapsed': round(elapsed, 1)
+        }
+        if adaptive:
+            stats['adaptive'] = adaptive.stats()
+        emit_load_stats(campaign, stats, final)
+    
+    dispatcher.prepare(max(target_at(0), 1))
+    while not campaign.stopped:
+        if deadline and time.monotonic() >= deadline:
+            break
+        if max_calls and placed >= max_calls:
+            break
+        
+        campaign.hold_while_tripped()
+        if campaign.stopped:
+            break
+        
+        # Wake up regularly to follow the profile and honour stop requests and the deadline
+        if not slots.acquire(target_at(time.monotonic() - started), timeout=0.5):
+            report()
+            continue
+        
+        phone_number, fields = next(destinations)
+        placed += 1
+        call_id = f"{options['mode']}_{placed}_{int(time.time())}"
+        display_number = f"{phone_number} ({options['mode'].capitalize()} call {placed})"
+        
+        campaign.emit('call_status', {
+            'call_id': call_id,
+            'phone_number': display_number,
+            'status': 'pending',
+            'message': 'Preparing to call'
+        })
+        dispatch_call(campaign, phone_number, call_id, display_number, on_complete=slots.release, fields=fields)
+        report()
+    
+    logger.info(f"{options['mode'].capitalize()} campaign finished placing calls after {placed} calls, waiting for {slots.live} live calls to end")
+    while not campaign.stopped and not slots.wait_empty(timeout=1.0):
+        report()
+    report(final=True)
+    
+    if not campaign.stopped:
+        campaign.emit('all_calls_completed')
+
+def run_arrival_campaign(campaign):
+    """Place calls at a target arrival rate, independent of how long each call lasts.
+
+    Dispatch times are fixed deadlines on the monotonic clock, each one a
+    sampled interval after the previous deadline rather than after the
+    previous dispatch, so API latency and sleep overshoot never accumulate
+    into rate drift.
+    """
+    options = campaign.options
+    if not campaign.number_count:
+        return
+    
+    # Numbers are read lazily with their list columns and dialed round-robin for as long as the campaign runs
+    destinations = campaign.cycle_rows()
+    
+    distribution = options['arrival_distribution']
+    curve = options['rate_curve']
+    duration = options['duration_minutes'] * 60
+    max_calls = options['max_calls']
+    logger.info(f"Starting arrival campaign: {options['calls_per_hour']} calls/hour, distribution={distribution}, "
+                f"duration={duration}s, max_calls={max_calls or 'unlimited'}")
+    
+    profile = options.get('load_profile')
+    
+    def rate_at(elapsed):
+        """Target arrival rate in calls per hour at the given campaign time."""
+        if profile:
+            return profile_value(profile, elapsed)
+        if distribution == 'curve':
+            return interpolate_curve(curve, elapsed)
+        return options['calls_per_hour']
+    
+    slots = LiveCallSlots()
+    started = time.monotonic()
+    deadline = started + duration if duration else None
+    next_at = started
+    placed = 0
+    
+    def report(final=False):
+        elapsed = time.monotonic() - started
+        emit_load_stats(campaign, {
+            'mode': 'arrival',
+            'unit': 'calls/hour',
+            'target': round(rate_at(elapsed), 1),
+            'achieved': round(placed * 3600 / elapsed, 1) if elapsed > 0 else 0,
+            'live': slots.live,
+            'placed': placed,
+            'elapsed': round(elapsed, 1)
+        }, final)
+    
+    dispatcher.prepare(1)
+    while not campaign.stopped:
+        now = time.monotonic()
+        if deadline and now >= deadline:
+            break
+        if max_calls and placed >= max_calls:
+            break
+        report()
+        
+        # Sleep towards the next deadline in short steps, waking early on a stop request
+        if now < next_at:
+            campaign.cancelled.wait(min(next_at - now, 1.0))
+            continue
+        
+        # Calls due while the circuit breaker is open are skipped, not made up in a burst afterwards
+        next_at += campaign.hold_while_tripped()
+        if campaign.stopped:
+            break
+        
+        rate = rate_at(next_at - started)
+        if rate <= 0:
+            # Nothing is due while the rate is zero; check again in a second
+            next_at += 1.0
+            continue
+        
+        phone_number, fields = next(destinations)
+        placed += 1
+        call_id = f"arrival_{placed}_{int(time.time())}"
+        slots.acquire(float('inf'))
+        campaign.emit('call_status', {
+            'call_id': call_id,
+            'phone_number': phone_number,
+            'status': 'pending',
+            'message': 'Preparing to call'
+        })
+        dispatch_call(campaign, phone_number, call_id, phone_number, on_complete=slots.release, fields=fields)
+        
+        mean_interval = 3600 / rate
+        if distribution == 'poisson':
+            next_at += random.expovariate(1 / mean_interval)
+        else:
+            next_at += mean_interval
+    
+    report(final=True)
+    logger.info(f"Arrival campaign placed {placed} calls in {time.monotonic() - started:.1f}s")
+    if not campaign.stopped:
+        campaign.emit('all_calls_completed')
+
+def run_parallel_campaign(campaign):
+    """Call many destinations in parallel with per-destination and global live-call caps."""
+    options = campaign.options
+    # The scheduler tracks every destination, so the list is read into memory here
+    numbers = list(campaign.numbers())
+    if not numbers:
+        return
+    # The list columns that pick each destination's greeting, only needed when the template was rendered
+    fields_of = dict(campaign.greeting_rows()) if campaign.renderings else {}
+    
+    scheduler = DestinationScheduler(numbers, options['calls_per_destination'],
+                                     options['per_destination_cap'], options['global_cap'])
+    duration = options['duration_minutes'] * 60
+    max_calls = options['max_calls']
+    logger.info(f"Starting parallel campaign over {len(scheduler.remaining)} destinations: "
+                f"{options['calls_per_destination']} calls each, per-destination cap {options['per_destination_cap']}, "
+                f"global cap {options['global_cap']}")
+    
+    started = time.monotonic()
+    deadline = started + duration if duration else None
+    placed = 0
+    
+    def report(final=False):
+        emit_load_stats(campaign, {
+            'mode': 'parallel',
+            'unit': 'live calls',
+            'target': scheduler.global_cap,
+            'achieved': scheduler.total_live,
+            'live': scheduler.total_live,
+            'placed': placed,
+            'elapsed': round(time.monotonic() - started, 1),
+            'active_destinations': sum(1 for n in scheduler.live.values() if n)
+        }, final)
+    
+    dispatcher.prepare(scheduler.global_cap)
+    while not campaign.stopped:
+        if deadline and time.monotonic() >= deadline:
+            break
+        if max_calls and placed >= max_calls:
+            break
+        
+        campaign.hold_while_tripped()
+        if campaign.stopped:
+            break
+        
+        phone_number = scheduler.acquire(timeout=1.0)
+        if phone_number is None:
+            if scheduler.exhausted:
+                break
+            report()
+            continue
+        
+        placed += 1
+        call_id = f"parallel_{placed}_{int(time.time())}"
+        campaign.emit('call_status', {
+            'call_id': call_id,
+            'phone_number': phone_number,
+            'status': 'pending',
+            'message': 'Preparing to call'
+        })
+        dispatch_call(campaign, phone_number, call_id, phone_number,
+                      on_complete=functools.partial(scheduler.release, phone_number),
+                      fields=fields_of.get(phone_number))
+        report()
+    
+    logger.info(f"Parallel campaign finished placing {placed} calls, waiting for {scheduler.total_live} live calls to end")
+    while not campaign.stopped and not scheduler.wait_empty(timeout=1.0):
+        report()
+    report(final=True)
+    
+    if not campaign.stopped:
+        campaign.emit('all_calls_completed')
+
+def run_burst_campaign(campaign):
+    """Release a burst of prepared calls at the same instant for spike testing.
+
+    Call arguments are built and Twilio connections opened before any call
+    is made. CPS tokens for the whole burst are reserved and waited for
+    before the gate is armed, so the limiter never spreads the burst out and
+    a slow token wait can't time out calls parked at the gate. Every call
+    then parks at the gate and all are released together.
+    """
+    options = campaign.options
+    if not campaign.number_count:
+        return
+    
+    # Numbers are read lazily with their list columns and dialed round-robin for as long as the campaign runs
+    destinations = campaign.cycle_rows()
+    
+    requested_size = options['burst_size']
+    size = min(requested_size, dispatcher.workers)
+    if size < requested_size:
+        logger.warning(f"Burst of {requested_size} exceeds the {dispatcher.workers} dispatch workers, capping it to {size}")
+    logger.info(f"Preparing burst of {size} calls for campaign {campaign.id}")
+    campaign.emit('campaign_prep', {
+        'stage': 'burst', 'size': size, 'requested_size': requested_size,
+        'message': f'Preparing a burst of {size} calls' + (
+            f' (capped from {requested_size} by the {dispatcher.workers} dispatch workers)' if size < requested_size else '')
+    })
+    
+    # Build every call's arguments up front, leaving out numbers on the do-not-call list
+    burst = []
+    number_count = campaign.number_count
+    suppressed_in_a_row = 0
+    while len(burst) < size:
+        row = next(destinations, None)
+        if row is None or suppressed_in_a_row >= number_count:
+            break
+        phone_number, fields = row
+        i = len(burst)
+        call_id = f"burst_{i}_{int(time.time())}"
+        display_number = f"{phone_number} (Burst call {i+1}/{size})"
+        if suppress_call(campaign, phone_number, call_id, display_number):
+            suppressed_in_a_row += 1
+            continue
+        suppressed_in_a_row = 0
+        campaign.emit('call_status', {
+            'call_id': call_id,
+            'phone_number': display_number,
+            'status': 'pending',
+            'message': 'Waiting for burst release'
+        })
+        call_kwargs = prepare_call(campaign, phone_number, call_id, display_number, fields)
+        burst.append((phone_number, call_id, display_number, call_kwargs, {}))
+    if not burst:
+        logger.warning(f"Every number of burst campaign {campaign.id} is on the do-not-call list")
+        return
+    size = len(burst)
+    
+    # Don't fire a burst into an API the circuit breaker has tripped on
+    campaign.hold_while_tripped()
+    if campaign.stopped:
+        return
+    
+    # Wait for the CPS tokens before arming the gate; parked calls give up after BURST_GATE_TIMEOUT
+    wait = call_rate_limiter.reserve(size)
+    if wait > 0:
+        logger.info(f"Waiting {wait:.2f}s for {size} CPS tokens before arming the burst")
+        campaign.emit('campaign_prep', {
+            'stage': 'burst', 'size': size, 'requested_size': requested_size,
+            'message': f'Waiting {wait:.1f}s for {size} calls-per-second tokens before the burst'
+        })
+        if campaign.cancelled.wait(wait):
+            return
+    
+    dispatcher.prepare(size)
+    gate = BurstGate(size, loop=dispatcher._loop if dispatcher.engine == 'asyncio' else None)
+    call_fn = make_burst_call_async if dispatcher.engine == 'asyncio' else make_burst_call
+    jobs = []
+    for phone_number, call_id, display_number, call_kwargs, timing in burst:
+        job = dispatcher.submit(call_fn, campaign, gate, timing, phone_number, call_id, display_number, call_kwargs)
+        campaign.count('placed')
+        campaign.track(job)
+        jobs.append(job)
+    
+    if not gate.wait_ready(burst_gate_timeout):
+        logger.warning(f"Only some burst calls were ready after {burst_gate_timeout}s, releasing anyway")
+    gate.release()
+    logger.info(f"Released burst of {size} calls at {gate.released_at:.6f}")
+    
+    for job in jobs:
+        job.wait()
+    
+    # Report how tightly the requests and responses were grouped
+    timings = [t for _, _, _, _, t in burst if 'sent' in t]
+    report = {'size': size, 'requested_size': requested_size, 'sent': len(timings),
+              'failed': sum(1 for t in timings if 'error' in t)}
+    if timings:
+        sent = [t['sent'] for t in timings]
+        received = [t['received'] for t in timings]
+        latencies = [t['received'] - t['sent'] for t in timings]
+        report.update({
+            'release_to_first_request_ms': round((min(sent) - gate.released_at) * 1000, 2),
+            'request_spread_ms': round((max(sent) - min(sent)) * 1000, 2),
+            'response_spread_ms': round((max(received) - min(received)) * 1000, 2),
+            'mean_latency_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+            'max_latency_ms': round(max(latencies) * 1000, 2)
+        })
+    logger.info(f"Burst report for campaign {campaign.id}: {report}")
+    campaign.emit('burst_report', report)
+    
+    if not campaign.stopped:
+        campaign.emit('all_calls_completed')
+
+def make_burst_call(campaign, gate, timing, phone_number, call_id, display_number, call_kwargs):
+    """Wait at the burst gate, then create one prepared call and time the request."""
+    if not gate.wait(burst_gate_timeout) or campaign.stopped:
+        report_call_error(campaign, RuntimeError("Burst was not released"), phone_number, call_id, display_number)
+        return
+    
+    try:
+        # CPS tokens for the whole burst were reserved before the gate was armed
+        timing['sent'] = time.time()
+        call = client.calls.create(**call_kwargs)
+        timing['received'] = time.time()
+        campaign.observe_create(timing['received'] - timing['sent'], None)
+        logger.info(f"Burst call {call_id}: request {timing['sent']:.6f}, response {timing['received']:.6f} "
+                    f"({(timing['received'] - timing['sent']) * 1000:.1f} ms), SID: {call.sid}")
+        record_call(campaign, call, phone_number, call_id, display_number)
+    except Exception as e:
+        timing['received'] = time.time()
+        timing['error'] = str(e)
+        campaign.observe_create(timing['received'] - timing['sent'], e)
+        report_call_error(campaign, e, phone_number, call_id, display_number)
+
+async def make_burst_call_async(campaign, gate, timing, phone_number, call_id, display_number, call_kwargs):
+    """Wait at the burst gate, then create one prepared call on the asyncio dispatcher and time the request."""
+    if not await gate.wait_async(burst_gate_timeout) or campaign.stopped:
+        report_call_error(campaign, RuntimeError("Burst was not released"), phone_number, call_id, display_number)
+        return
+    
+    try:
+        # CPS tokens for the whole burst were reserved before the gate was armed
+        timing['sent'] = time.time()
+        call = await dispatcher.client.calls.create_async(**call_kwargs)
+        timing['received'] = time.time()
+        campaign.observe_create(timing['received'] - timing['sent'], None)
+        logger.info(f"Burst call {call_id}: request {timing['sent']:.6f}, response {timing['received']:.6f} "
+                    f"({(timing['received'] - timing['sent']) * 1000:.1f} ms), SID: {call.sid}")
+        record_call(campaign, call, phone_number, call_id, display_number)
+    except Exception as e:
+        timing['received'] = time.time()
+        timing['error'] = str(e)
+        campaign.observe_create(timing['received'] - timing['sent'], e)
+        report_call_error(campaign, e, phone_number, call_id, display_number)
+
+def prepare_call(campaign, phone_number, call_id, display_number, fields=None):
+    """Build the call-create arguments for a single call and report it as initiating.
+
+    fields are the list columns of the number's row, which pick its greeting
+    when the campaign's greeting is a template.
+    """
+    logger.info(f"Making call to {phone_number} (ID: {call_id}, campaign: {campaign.id})")
+    
+    # Pick the MP3 for this call; everything else in the call plan is fixed for the campaign
+    mp3_file = ''
+    if campaign.playback_mode in ['tts_mp3', 'mp3_only']:
+        if campaign.mp3_selection == 'random':
+            if mp3_files:
+                mp3_file = random.choice(mp3_files)
+                logger.info(f"Selected random MP3: {mp3_file}")
+            else:
+                logger.warning("No MP3 files available for random selection")
+        else:
+            mp3_file = campaign.mp3_file
+            logger.info(f"Using specific MP3: {campaign.mp3_file}")
+    token = campaign.call_plan_token(mp3_file, phone_number, fields)
+    logger.info(f"Using call plan {token}")
+    
+    # Send the TwiML inline, saving Twilio the /twiml round trip
+    twiml = None
+    if inline_twiml:
+        twiml = call_plans.twiml(token).decode()
+        if len(twiml) > INLINE_TWIML_MAX_CHARS:
+            logger.info(f"TwiML for {call_id} is {len(twiml)} characters, over the inline limit; using the /twiml URL")
+            twiml = None
+    
+    if twiml:
+        logger.info(f"Inline TwiML: {twiml}")
+        twiml_source = {'twiml': twiml}
+    else:
+        twiml_url = f"{base_url}/twiml?plan={token}"
+        logger.info(f"TwiML URL: {twiml_url}")
+        twiml_source = {'url': twiml_url}
+    
+    # Log Twilio credentials (partial for security)
+    logger.info(f"Using Twilio account: {account_sid[:4]}...{account_sid[-4:]}")
+    logger.info(f"Using Twilio phone number: {twilio_number}")
+    
+    # Emit in-progress status
+    try:
+        campaign.emit('call_status', {
+            'call_id': call_id,
+            'phone_number': display_number,
+            'status': 'in-progress',
+            'message': 'Initiating call'
+        })
+        logger.info(f"Emitted in-progress status for {call_id}")
+    except Exception as e:
+        logger.error(f"Failed to emit call status: {str(e)}")
+    
+    return {
+        'to': phone_number,
+        'from_': twilio_number,
+        **twiml_source,
+        'status_callback': f"{base_url}/call-status",
+        'status_callback_event': ['initiated', 'ringing', 'answered', 'completed'],
+        'status_callback_method': 'POST'
+    }
+
+def record_call(campaign, call, phone_number, call_id, display_number, on_complete=None):
+    """Store a newly created call and report it to the client."""
+    calls[call.sid] = {
+        'call_id': call_id,
+        'phone_number': display_number,
+        'status': 'initiated',
+        'room': campaign.room,
+        'campaign_id': campaign.id,
+        'on_complete': on_complete,
+        'created_at': time.monotonic()
+    }
+    if on_complete:
+        start_call_reaper()
+    campaign.count('initiated')
+    campaign.checkpoint_item(call_id, 'dialed', call_sid=call.sid)
+    
+    logger.info(f"Call initiated to {phone_number}, SID: {call.sid}")
+    
+    # A call created after its campaign was stopped is ended straight away
+    if campaign.stopped and campaign.hang_up_on_stop:
+        hangup_executor.submit(hang_up_call, call.sid)
+    
+    # Emit status update
+    campaign.emit('call_status', {
+        'call_id': call_id,
+        'phone_number': display_number,
+        'status': 'in-progress',
+        'message': f'Call initiated (SID: {call.sid})'
+    })
+    logger.info(f"Emitted call initiated status for {call_id}")
+
+def skip_stopped_call(campaign, call_id, display_number, on_complete=None):
+    """Drop a queued call whose campaign was stopped before it was placed; return True if it was dropped.
+
+    Its dial item goes back to pending, since the number was never dialed.
+    """
+    if not campaign.stopped:
+        return False
+    
+    logger.info(f"Not placing {call_id}: campaign {campaign.id} was stopped")
+    campaign.checkpoint_item(call_id, 'pending')
+    if on_complete:
+        on_complete()
+    campaign.emit('call_status', {
+        'call_id': call_id,
+        'phone_number': display_number,
+        'status': 'failed',
+        'message': 'Not placed: the campaign was stopped'
+    })
+    return True
+
+def suppress_call(campaign, phone_number, call_id, display_number, on_complete=None):
+    """Skip a call to a number on the do-not-call list; return True if it was skipped."""
+    if phone_number not in dnc_list:
+        return False
+    
+    logger.info(f"Skipping {phone_number}: number is on the do-not-call list")
+    campaign.count('suppressed')
+    campaign.checkpoint_item(call_id, 'suppressed')
+    if on_complete:
+        on_complete()
+    campaign.emit('call_status', {
+        'call_id': call_id,
+        'phone_number': display_number,
+        'status': 'failed',
+        'message': 'Skipped: number is on the do-not-call list'
+    })
+    return True
+
+def report_call_retry(campaign, error, attempt, delay, call_id, display_number):
+    """Report a call-creation error that will be retried."""
+    logger.warning(f"Transient error creating {call_id} (attempt {attempt}/{create_retries}), "
+                   f"retrying in {delay:.2f}s: {str(error)}")
+    campaign.emit('call_status', {
+        'call_id': call_id,
+        'phone_number': display_number,
+        'status': 'pending',
+        'message': f'Retrying in {delay:.1f}s (attempt {attempt}/{create_retries}): {str(error)}'
+    })
+
+def report_call_error(campaign, error, phone_number, call_id, display_number, on_complete=None):
+    """Report a call that could not be created."""
+    logger.error(f"Error making call to {phone_number}: {str(error)}", exc_info=error)
+    campaign.count('failed')
+    campaign.checkpoint_item(call_id, 'failed', error=str(error))
+    if on_complete:
+        on_complete()
+    
+    # Emit error status
+    try:
+        campaign.emit('call_status', {
+            'call_id': call_id,
+            'phone_number': display_number,
+            'status': 'failed',
+            'message': f'Error: {str(error)}'
+        })
+        logger.info(f"Emitted error status for {call_id}")
+    except Exception as emit_error:
+        logger.error(f"Failed to emit error status: {str(emit_error)}")
+
+def make_single_call(campaign, phone_number, call_id, display_number, on_complete=None, fields=None):
+    """Make a single call with the campaign's settings.
+
+    on_complete is called once when the call ends or could not be created.
+    """
+    if (skip_stopped_call(campaign, call_id, display_number, on_complete)
+            or suppress_call(campaign, phone_number, call_id, display_number, on_complete)):
+        return
+    try:
+        call_kwargs = prepare_call(campaign, phone_number, call_id, display_number, fields)
+        
+        # Make the call, retrying errors from before Twilio accepted the request
+        logger.info(f"Calling Twilio API for {phone_number}")
+        attempt = 0
+        while True:
+            try:
+                call = create_call(observer=campaign.observe_create, cancelled=campaign.cancelled,
+                                   on_send=functools.partial(campaign.mark_dispatched, call_id), **call_kwargs)
+                if call is None:
+                    skip_stopped_call(campaign, call_id, display_number, on_complete)
+                    return
+                logger.info(f"Twilio API call succeeded, SID: {call.sid}")
+                break
+            except Exception as e:
+                delay = retry_delay(campaign, e, attempt)
+                if delay is None:
+                    logger.error(f"Twilio API call failed: {str(e)}", exc_info=True)
+                    raise
+                attempt += 1
+                report_call_retry(campaign, e, attempt, delay, call_id, display_number)
+                campaign.cancelled.wait(delay)
+        
+        record_call(campaign, call, phone_number, call_id, display_number, on_complete)
+    except Exception as e:
+        report_call_error(campaign, e, phone_number, call_id, display_number, on_complete)
+
+async def make_single_call_async(campaign, phone_number, call_id, display_number, on_complete=None, fields=None):
+    """Make a single call on the asyncio dispatcher's pooled Twilio client."""
+    if (skip_stopped_call(campaign, call_id, display_number, on_complete)
+            or suppress_call(campaign, phone_number, call_id, display_number, on_complete)):
+        return
+    try:
+        call_kwargs = prepare_call(campaign, phone_number, call_id, display_number, fields)
+        
+        # Make the call, retrying errors from before Twilio accepted the request
+        logger.info(f"Calling Twilio API (async) for {phone_number}")
+        attempt = 0
+        while True:
+            try:
+                call = await create_call_async(observer=campaign.observe_create, cancelled=campaign.cancelled,
+                                               on_send=functools.partial(campaign.mark_dispatched, call_id),
+                                               **call_kwargs)
+                if call is None:
+                    skip_stopped_call(campaign, call_id, display_number, on_complete)
+                    return
+                logger.info(f"Twilio API call succeeded, SID: {call.sid}")
+                break
+            except Exception as e:
+                delay = retry_delay(campaign, e, attempt)
+                if delay is None:
+                    logger.error(f"Twilio API call failed: {str(e)}", exc_info=True)
+                    raise
+                attempt += 1
+                report_call_retry(campaign, e, attempt, delay, call_id, display_number)
+                await asyncio.sleep(delay)
+        
+        record_call(campaign, call, phone_number, call_id, display_number, on_complete)
+    except Exception as e:
+        report_call_error(campaign, e, phone_number, call_id, display_number, on_complete)
+
+def dispatch_call(campaign, phone_number, call_id, display_number, on_complete=None, queue_item=None, fields=None):
+    """Queue a single call for a campaign on the dispatcher using the engine's call function.
+
+    queue_item is the sequence number of the dial item the call comes from,
+    if any; it is checkpointed as dispatched when its request is sent, and
+    then with its outcome, in the campaign store. fields are the list
+    columns of the number's row, passed on to prepare_call.
+    """
+    if queue_item is not None:
+        with campaign._lock:
+            campaign.queue_items[call_id] = (queue_item, phone_number)
+    call_fn = make_single_call_async if dispatcher.engine == 'asyncio' else make_single_call
+    job = dispatcher.submit(call_fn, campaign, phone_number, call_id, display_number, on_complete=on_complete,
+                            fields=fields)
+    campaign.count('placed')
+    campaign.track(job)
+    return job
+
+@app.route('/call-status', methods=['POST'])
+def call_status():
+    """Handle call status callbacks from Twilio."""
+    call_sid = request.form.get('CallSid')
+    call_status = request.form.get('CallStatus')
+    
+    logger.info(f"Call status update - SID: {call_sid}, Status: {call_status}")
+    
+    update_call_status(call_sid, call_status)
+    return '', 204
+
+def update_call_status(call_sid, call_status):
+    """Record a call's status, report it to the client and free its live-call slot once it has ended."""
+    call_info = calls.get(call_sid)
+    if call_info is None:
+        return
+    call_info['status'] = call_status
+    
+    # Emit status update to the client
+    socketio.emit('call_status', {
+        'call_id': call_info['call_id'],
+        'phone_number': call_info['phone_number'],
+        'status': 'completed' if call_status in TERMINAL_CALL_STATUSES else 'in-progress',
+        'message': f'Call {call_status}',
+        'campaign_id': call_info.get('campaign_id')
+    }, room=call_info['room'])
+    
+    # Let the campaign that placed the call know its slot is free
+    if call_status in TERMINAL_CALL_STATUSES and 'on_complete' in call_info:
+        campaign = get_campaign(call_info.get('campaign_id'))
+        if campaign:
+            campaign.count('completed')
+            if campaign.adaptive:
+                campaign.adaptive.record_status(call_status)
+        on_complete = call_info.pop('on_complete', None)
+        if on_complete:
+            on_complete()
+
+call_reaper_started = False
+call_reaper_lock = threading.Lock()
+
+def start_call_reaper():
+    """Start the background sweep of stale live-call slots on first use."""
+    global call_reaper_started
+    with call_reaper_lock:
+        if call_reaper_started:
+            return
+        call_reaper_started = True
+    Thread(target=reap_stale_calls, name="call-reaper", daemon=True).start()
+
+def reap_stale_calls():
+    """Free the live-call slots of calls whose final status callback never arrived.
+
+    A lost callback (wrong BASE_URL, an error at the webhook, a restart)
+    would otherwise hold its slot forever and shrink the campaign's
+    concurrency. Calls older than CALL_STATUS_POLL_AFTER are fetched from
+    Twilio, at most once per that interval, and completed if they have
+    ended; calls older than CALL_LEASE_SECONDS have their slot freed
+    whatever Twilio says.
+    """
+    interval = max(1.0, min(60.0, call_status_poll_after / 2))
+    while True:
+        time.sleep(interval)
+        now = time.monotonic()
+        for call_sid, call_info in list(calls.items()):
+            if 'on_complete' not in call_info:
+                continue
+            age = now - call_info['created_at']
+            if age >= call_lease_seconds:
+                logger.warning(f"No final status for call {call_sid} after {age:.0f}s; freeing its slot")
+                on_complete = call_info.pop('on_complete', None)
+                if on_complete:
+                    on_complete()
+                continue
+            if age < call_status_poll_after or now - call_info.get('polled_at', call_info['created_at']) < call_status_poll_after:
                 continue
             
-            # Generate a unique call ID
-            call_id = f"call_{i}_{int(time.time())}"
-            
-            # Emit pending status
-            socketio.emit('call_status', {
-                'call_id': call_id,
-                'phone_number': phone_number,
-                'status': 'pending',
-                'message': 'Preparing to call'
-            }, room=client_sid)
-            
-            # Make the single call
-            make_single_call(
-                phone_number,
-                call_id,
-                phone_number,
-                use_custom_greeting,
-                custom_greeting,
-                playback_mode,
-                mp3_selection,
-                mp3_file,
-                tts_provider,
-                eleven_labs_voice,
-                save_tts,
-                client_sid
-            )
-            
-            # Wait for the specified delay before making the next call
-            if i < len(phone_numbers) - 1 and not stop_calls_flag:
-                time.sleep(delay)
-        
-        # All calls completed
-        if not stop_calls_flag:
-            socketio.emit('all_calls_completed', room=client_sid)
+            call_info['polled_at'] = now
+            try:
+                status = client.calls(call_sid).fetch().status
+            except Exception as e:
+                logger.warning(f"Could not fetch the status of call {call_sid}: {str(e)}")
+                continue
+            if status in TERMINAL_CALL_STATUSES:
+                logger.warning(f"Missed the final status callback of call {call_sid} ({status})")
+                update_call_status(call_sid, status)
 
-def make_single_call(phone_number, call_id, display_number, use_custom_greeting, custom_greeting,
-                    playback_mode, mp3_selection, mp3_file, tts_provider, 
-                    eleven_labs_voice, save_tts, client_sid):
-    """Make a single call with the specified settings."""
-    try:
-        logger.info(f"Making call to {phone_number} (ID: {call_id})")
-        
-        # Prepare TwiML URL parameters
-        url_params = {
-            'use_custom_greeting': 'true' if use_custom_greeting else 'false',
-            'playback_mode': playback_mode,
-            'tts_provider': tts_provider,
-            'call_id': call_id
+class TTSProvider(ABC):
+    """A text-to-speech service that renders text to an audio file."""
+
+    name = None
+    label = None
+
+    @abstractmethod
+    def available(self):
+        """Whether the provider is configured and can synthesize on this host."""
+
+    @abstractmethod
+    def cache_params(self, text, voice):
+        """Everything that decides the audio for text and voice, for the TTS cache key."""
+
+    @abstractmethod
+    def synthesize(self, text, voice, dest_path):
+        """Write the audio for text and voice to dest_path; return True on success."""
+
+class ElevenLabsProvider(TTSProvider):
+    """Eleven Labs text-to-speech, with voices configured by name in ELEVENLABS_VOICES.
+
+    A semaphore bounds the requests in flight to stay under the account's
+    concurrency limit. Requests share one keep-alive session, and audio is
+    streamed to disk as it arrives instead of being buffered in memory.
+    """
+
+    name = 'elevenlabs'
+    label = 'Eleven Labs'
+
+    def __init__(self, concurrency):
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=max(1, concurrency)))
+
+    def available(self):
+        return bool(elevenlabs_api_key)
+
+    def voice_id(self, voice):
+        return elevenlabs_voices.get(voice)
+
+    def cache_params(self, text, voice):
+        return {
+            'text': text,
+            'voice_id': self.voice_id(voice),
+            'model': elevenlabs_model,
+            'stability': elevenlabs_stability,
+            'similarity': elevenlabs_similarity
         }
+
+    def synthesize(self, text, voice, dest_path):
+        if not elevenlabs_api_key:
+            logger.error("Eleven Labs API key is not set")
+            return False
         
-        if use_custom_greeting and custom_greeting:
-            url_params['greeting'] = custom_greeting
-            logger.info(f"Using custom greeting: {custom_greeting}")
-        
-        if playback_mode in ['tts_mp3', 'mp3_only']:
-            if mp3_selection == 'random':
-                if mp3_files:
-                    url_params['mp3_file'] = random.choice(mp3_files)
-                    logger.info(f"Selected random MP3: {url_params['mp3_file']}")
-                else:
-                    logger.warning("No MP3 files available for random selection")
-            else:
-                url_params['mp3_file'] = mp3_file
-                logger.info(f"Using specific MP3: {mp3_file}")
+        # Get the voice ID from the voice name
+        voice_id = self.voice_id(voice)
+        if not voice_id:
+            logger.error(f"Voice {voice} not found in configured voices")
+            return False
         
-        if tts_provider == 'elevenlabs' and eleven_labs_voice:
-            url_params['voice'] = eleven_labs_voice
-            logger.info(f"Using Eleven Labs voice: {eleven_labs_voice}")
+        # Prepare API request
+        url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}/stream"
         
-        if save_tts:
-            url_params['save_tts'] = 'true'
+        headers = {
+            "Accept": "audio/mpeg",
+            "Content-Type": "application/json",
+            "xi-api-key": elevenlabs_api_key
+        }
         
-        # Construct the TwiML URL
-        twiml_url = f"{base_url}/twiml?{urllib.parse.urlencode(url_params)}"
-        logger.info(f"TwiML URL: {twiml_url}")
+        data = {
+            "text": text,
+            "model_id": elevenlabs_model,
+            "voice_settings": {
+                "stability": elevenlabs_stability,
+                "similarity_boost": elevenlabs_similarity
+            }
+        }
         
-        # Log Twilio credentials (partial for security)
-        logger.info(f"Using Twilio account: {account_sid[:4]}...{account_sid[-4:]}")
-        logger.info(f"Using Twilio phone number: {twilio_number}")
+        try:
+            # Make the API request
+            logger.info(f"Making Eleven Labs API request for voice {voice} (ID: {voice_id})")
+            with self._slots:
+                started = time.monotonic()
+                with self.session.post(url, json=data, headers=headers, stream=True,
+                                       timeout=(elevenlabs_connect_timeout, elevenlabs_read_timeout)) as response:
+                    if response.status_code != 200:
+                        logger.error(f"Eleven Labs API error: {response.status_code} - {response.text}")
+                        return False
+                    
+                    # Write audio chunks as they arrive
+                    first_byte = None
+                    size = 0
+                    with open(dest_path, 'wb') as f:
+                        for chunk in response.iter_content(chunk_size=16384):
+                            if first_byte is None:
+                                first_byte = time.monotonic() - started
+                            f.write(chunk)
+                            size += len(chunk)
+            
+            if not size:
+                logger.error("Eleven Labs returned no audio")
+                return False
+            logger.info(f"Eleven Labs audio: first byte after {first_byte * 1000:.0f} ms, "
+                        f"{size} bytes in {(time.monotonic() - started) * 1000:.0f} ms")
+            return True
+        except Exception as e:
+            logger.error(f"Exception during Eleven Labs API call: {str(e)}", exc_info=True)
+            return False
+
+class LocalTTSProvider(TTSProvider):
+    """Offline text-to-speech with espeak-ng or piper installed on this host, with voices configured in LOCAL_TTS_VOICES.
+
+    Each synthesis runs the engine in its own process, which writes WAV that
+    pydub encodes to MP3. A semaphore bounds the processes running at once,
+    so parallel pre-rendering spreads over the CPU cores without
+    oversubscribing them.
+    """
+
+    name = 'local'
+    label = 'local TTS'
+
+    def __init__(self, engine, binary, voices, concurrency):
+        self.engine = engine
+        self.binary = binary
+        self.voices = voices
+        self._slots = threading.BoundedSemaphore(max(1, concurrency))
+
+    def available(self):
+        return bool(shutil.which(self.binary) and shutil.which(AudioSegment.converter))
+
+    def engine_voice(self, voice):
+        """The espeak-ng voice or piper model for a voice name, defaulting to the first configured voice."""
+        return self.voices.get(voice) or next(iter(self.voices.values()), None)
+
+    def cache_params(self, text, voice):
+        return {'text': text, 'engine': self.engine, 'voice': self.engine_voice(voice)}
+
+    def command(self, engine_voice, wav_path):
+        """The engine command line that reads text on stdin and writes WAV to wav_path."""
+        if self.engine == 'piper':
+            return [self.binary, '--model', engine_voice, '--output_file', wav_path]
+        return [self.binary, '-v', engine_voice, '-w', wav_path, '--stdin']
+
+    def synthesize(self, text, voice, dest_path):
+        engine_voice = self.engine_voice(voice)
+        if not engine_voice:
+            logger.error("No local TTS voices are configured")
+            return False
         
-        # Emit in-progress status
+        wav_path = f"{dest_path}.wav"
         try:
-            socketio.emit('call_status', {
-                'call_id': call_id,
-                'phone_number': display_number,
-                'status': 'in-progress',
-                'message': 'Initiating call'
-            }, room=client_sid)
-            logger.info(f"Emitted in-progress status for {call_id}")
+            with self._slots:
+                started = time.monotonic()
+                result = subprocess.run(self.command(engine_voice, wav_path), input=text.encode(),
+                                        capture_output=True, timeout=local_tts_timeout)
+                if result.returncode != 0:
+                    logger.error(f"{self.engine} exited with status {result.returncode}: "
+                                 f"{result.stderr.decode(errors='replace').strip()}")
+                    return False
+                AudioSegment.from_wav(wav_path).export(dest_path, format='mp3')
+            logger.info(f"{self.engine} rendered {len(text)} characters with voice {engine_voice} "
+                        f"in {(time.monotonic() - started) * 1000:.0f} ms")
+            return True
         except Exception as e:
-            logger.error(f"Failed to emit call status: {str(e)}")
+            logger.error(f"Exception during {self.engine} synthesis: {str(e)}", exc_info=True)
+            return False
+        finally:
+            if os.path.exists(wav_path):
+                os.remove(wav_path)
+
+class TTSCache:
+    """Content-addressed store of synthesized audio with LRU eviction under a byte budget.
+
+    Files are named by a hash of the provider and everything that decides
+    the audio, so identical requests share one file. The index of sizes in
+    least-recently-used order lives in memory and is rebuilt from the
+    directory, oldest modification time first, on startup; a hit refreshes
+    the file's modification time so the order survives restarts.
+
+    Files pinned by running campaigns are never evicted, even if that keeps
+    the cache over its budget until they are unpinned.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index = OrderedDict()
+        self._pins = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
         
-        # Make the call
-        logger.info(f"Calling Twilio API for {phone_number}")
+        os.makedirs(directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            if name.endswith('.mp3') and os.path.isfile(path):
+                stat = os.stat(path)
+                entries.append((stat.st_mtime, name[:-4], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._bytes += size
+
+    @staticmethod
+    def key_for(provider, params):
+        return hashlib.sha256(json.dumps(dict(params, provider=provider), sort_keys=True).encode()).hexdigest()[:32]
+
+    def path(self, key):
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def key_of(self, path):
+        """The key of a path in the cache, or None for a file elsewhere."""
+        if os.path.dirname(os.path.abspath(path)) != os.path.abspath(self.directory):
+            return None
+        return os.path.basename(path)[:-len('.mp3')]
+
+    def contains(self, key):
+        """Whether a key is cached, without counting a lookup."""
+        with self._lock:
+            return key in self._index
+
+    def get(self, key):
+        """Return the path of a cached file and mark it recently used, or None on a miss."""
+        with self._lock:
+            if key not in self._index:
+                self._misses += 1
+                return None
+            self._index.move_to_end(key)
+            self._hits += 1
+        path = self.path(key)
         try:
-            call = client.calls.create(
-                to=phone_number,
-                from_=twilio_number,
-                url=twiml_url,
-                status_callback=f"{base_url}/call-status",
-                status_callback_event=['initiated', 'ringing', 'answered', 'completed'],
-                status_callback_method='POST'
-            )
-            logger.info(f"Twilio API call succeeded, SID: {call.sid}")
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._bytes -= self._index.pop(key, 0)
+            return None
+        return path
+
+    def put(self, key, tmp_path):
+        """Move a finished file into the cache, evicting least recently used files beyond the budget."""
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, self.path(key))
+        with self._lock:
+            self._bytes += size - self._index.pop(key, 0)
+            self._index[key] = size
+            evicted = self._evict(keep=key)
+        self._remove(evicted)
+        return self.path(key)
+
+    def pin(self, key):
+        """Keep a cached file from eviction until it is unpinned; False if it is no longer cached."""
+        with self._lock:
+            if key not in self._index:
+                return False
+            self._pins[key] = self._pins.get(key, 0) + 1
+            return True
+
+    def unpin(self, key):
+        with self._lock:
+            if self._pins.get(key, 0) > 1:
+                self._pins[key] -= 1
+            else:
+                self._pins.pop(key, None)
+            evicted = self._evict()
+        self._remove(evicted)
+
+    def _evict(self, keep=None):
+        """Drop least recently used, unpinned files until the cache is within budget; return their keys."""
+        excess = self._bytes - self.max_bytes
+        evicted = []
+        for old_key, old_size in self._index.items():
+            if excess <= 0:
+                break
+            if old_key != keep and old_key not in self._pins:
+                evicted.append(old_key)
+                excess -= old_size
+        for old_key in evicted:
+            self._bytes -= self._index.pop(old_key)
+            self._evictions += 1
+        return evicted
+
+    def _remove(self, keys):
+        for key in keys:
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def temp_path(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.part')
+        os.close(fd)
+        return tmp_path
+
+    def stats(self):
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'entries': len(self._index),
+                'pinned': len(self._pins),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': round(self._hits / lookups, 3) if lookups else 0,
+                'evictions': self._evictions
+            }
+
+class SingleFlight:
+    """Coalesces concurrent calls for the same key into one.
+
+    The first caller for a key runs the function; callers that arrive while
+    it runs wait for its result (or error) instead of running it again.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+        self._leaders = 0
+        self._coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+                self._leaders += 1
+            else:
+                self._coalesced += 1
+        
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result']
+        
+        try:
+            call['result'] = fn()
+            return call['result']
         except Exception as e:
-            logger.error(f"Twilio API call failed: {str(e)}", exc_info=True)
+            call['error'] = e
             raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call['done'].set()
+
+    def stats(self):
+        with self._lock:
+            return {'in_flight': len(self._calls), 'leaders': self._leaders, 'coalesced': self._coalesced}
+
+class LatencyHistogram:
+    """Counts of latencies in fixed buckets, with their mean and maximum and a count of failures.
+
+    Percentiles are reported as the upper bound of the bucket they fall in,
+    or None when they fall past the last bucket.
+    """
+
+    BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+    def __init__(self):
+        self._counts = [0] * (len(self.BUCKETS) + 1)
+        self._total = 0.0
+        self._max = 0.0
+        self._failures = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds, ok=True):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.BUCKETS, seconds)] += 1
+            self._total += seconds
+            self._max = max(self._max, seconds)
+            if not ok:
+                self._failures += 1
+
+    def _percentile(self, q, count):
+        rank = q * count
+        seen = 0
+        for bound, n in zip(self.BUCKETS, self._counts):
+            seen += n
+            if seen >= rank:
+                return round(bound * 1000)
+        return None
+
+    def stats(self):
+        with self._lock:
+            count = sum(self._counts)
+            labels = [f"<={round(bound * 1000)}ms" for bound in self.BUCKETS] + [f">{round(self.BUCKETS[-1] * 1000)}ms"]
+            return {
+                'count': count,
+                'failures': self._failures,
+                'mean_ms': round(self._total / count * 1000) if count else None,
+                'max_ms': round(self._max * 1000),
+                'p50_ms': self._percentile(0.5, count) if count else None,
+                'p90_ms': self._percentile(0.9, count) if count else None,
+                'p99_ms': self._percentile(0.99, count) if count else None,
+                'buckets': dict(zip(labels, self._counts))
+            }
+
+class HedgedSynthesis:
+    """Speech synthesis within a latency budget, racing a fallback provider when the chosen one is slow.
+
+    When the chosen provider hasn't returned audio within the budget, or
+    fails before it, the same text is sent to the fallback provider and
+    whichever returns audio first wins. The other keeps running in the
+    background, so its audio still lands in the cache for next time.
+    """
+
+    def __init__(self, budget, fallback):
+        self.budget = budget
+        self.fallback = fallback
+        self._lock = threading.Lock()
+        self._counts = {'requests': 0, 'hedged': 0, 'primary_wins': 0, 'fallback_wins': 0, 'failed': 0}
+
+    def count(self, counter):
+        with self._lock:
+            self._counts[counter] += 1
+
+    def fallback_for(self, provider):
+        """The provider to race against provider, or None if there is no available one."""
+        fallback = tts_providers.get(self.fallback)
+        if fallback is None or self.fallback == provider or not fallback.available():
+            return None
+        return self.fallback
+
+    def synthesize(self, text, voice, provider):
+        """Return the cache path of the audio and the provider that produced it, or (None, None)."""
+        self.count('requests')
+        fallback = self.fallback_for(provider)
+        if fallback is None or self.budget <= 0:
+            path = synthesize_speech(text, voice, provider)
+            self.count('primary_wins' if path else 'failed')
+            return (path, provider) if path else (None, None)
         
-        # Store call information
-        calls[call.sid] = {
-            'call_id': call_id,
-            'phone_number': display_number,
-            'status': 'initiated',
-            'client_sid': client_sid
-        }
+        results = queue.Queue()
         
-        logger.info(f"Call initiated to {phone_number}, SID: {call.sid}")
+        def run(name):
+            try:
+                path = synthesize_speech(text, voice, name)
+            except Exception as e:
+                logger.error(f"{tts_providers[name].label} synthesis failed: {str(e)}", exc_info=True)
+                path = None
+            results.put((name, path))
         
-        # Emit status update
-        socketio.emit('call_status', {
-            'call_id': call_id,
-            'phone_number': display_number,
-            'status': 'in-progress',
-            'message': f'Call initiated (SID: {call.sid})'
-        }, room=client_sid)
-        logger.info(f"Emitted call initiated status for {call_id}")
-            
-    except Exception as e:
-        logger.error(f"Error making call to {phone_number}: {str(e)}", exc_info=True)
+        Thread(target=run, args=(provider,), daemon=True).start()
+        deadline = time.monotonic() + self.budget
+        pending = 1
+        hedged = False
+        while pending:
+            try:
+                name, path = results.get(timeout=None if hedged else max(0, deadline - time.monotonic()))
+                pending -= 1
+            except queue.Empty:
+                name = path = None
+            if path:
+                self.count('primary_wins' if name == provider else 'fallback_wins')
+                return path, name
+            if not hedged:
+                hedged = True
+                pending += 1
+                self.count('hedged')
+                reason = 'failed' if name else f'took over {self.budget:g}s'
+                logger.warning(f"{tts_providers[provider].label} synthesis {reason}, "
+                               f"racing {tts_providers[fallback].label}")
+                Thread(target=run, args=(fallback,), daemon=True).start()
         
-        # Emit error status
-        try:
-            socketio.emit('call_status', {
-                'call_id': call_id,
-                'phone_number': display_number,
-                'status': 'failed',
-                'message': f'Error: {str(e)}'
-            }, room=client_sid)
-            logger.info(f"Emitted error status for {call_id}")
-        except Exception as emit_error:
-            logger.error(f"Failed to emit error status: {str(emit_error)}")
+        self.count('failed')
+        return None, None
 
-@app.route('/call-status', methods=['POST'])
-def call_status():
-    """Handle call status callbacks from Twilio."""
-    call_sid = request.form.get('CallSid')
-    call_status = request.form.get('CallStatus')
-    
-    logger.info(f"Call status update - SID: {call_sid}, Status: {call_status}")
+    def stats(self):
+        with self._lock:
+            return dict(self._counts, budget=self.budget, fallback=self.fallback or None)
+
+tts_providers = {
+    'elevenlabs': ElevenLabsProvider(elevenlabs_concurrency),
+    'local': LocalTTSProvider(local_tts_engine, local_tts_binary, local_tts_voices, local_tts_concurrency)
+}
+tts_cache = TTSCache(tts_cache_dir, tts_cache_max_bytes)
+tts_flights = SingleFlight()
+tts_latency = {name: LatencyHistogram() for name in tts_providers}
+tts_hedge = HedgedSynthesis(tts_latency_budget, tts_fallback_provider)
+
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+def split_sentences(text):
+    """Split text into sentences at ., ! or ? followed by whitespace."""
+    return [sentence for sentence in (part.strip() for part in SENTENCE_END.split(text.strip())) if sentence]
+
+def synthesize_text(tts, text, voice):
+    """Return the cache path of one piece of text in a provider's voice, synthesizing it on a miss, or None.
+
+    Concurrent misses for the same audio share a single synthesis.
+    """
+    key = tts_cache.key_for(tts.name, tts.cache_params(text, voice))
+    path = tts_cache.get(key)
+    if path:
+        logger.info(f"TTS cache hit for {tts.name} voice {voice}: {key}")
+        return path
     
-    if call_sid in calls:
-        call_info = calls[call_sid]
-        call_info['status'] = call_status
+    def synthesize_into_cache():
+        # A flight for this key may have finished between the cache miss and now
+        if tts_cache.contains(key):
+            return tts_cache.path(key)
         
-        # Emit status update to the client
-        socketio.emit('call_status', {
-            'call_id': call_info['call_id'],
-            'phone_number': call_info['phone_number'],
-            'status': 'completed' if call_status in ['completed', 'busy', 'no-answer', 'failed'] else 'in-progress',
-            'message': f'Call {call_status}'
-        }, room=call_info['client_sid'])
+        tmp_path = tts_cache.temp_path()
+        try:
+            started = time.monotonic()
+            ok = tts.synthesize(text, voice, tmp_path)
+            tts_latency[tts.name].record(time.monotonic() - started, ok)
+            if not ok:
+                return None
+            logger.info(f"Synthesized {len(text)} characters with {tts.name} voice {voice} in {time.monotonic() - started:.2f}s")
+            return tts_cache.put(key, tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
     
-    return '', 204
+    return tts_flights.do(key, synthesize_into_cache)
 
-def generate_elevenlabs_speech(text, voice_name, save_path=None):
-    """Generate speech using the Eleven Labs API and return a URL to the audio file."""
-    logger.info(f"Generating Eleven Labs speech with voice: {voice_name}")
+def synthesize_segmented(tts, sentences, voice):
+    """Return the cache path of sentences synthesized one by one and joined, or None.
+
+    Each sentence is cached on its own, so greetings that share sentences
+    only synthesize the ones that differ. The joined audio is cached too,
+    under a key over the segment keys.
+    """
+    segment_keys = [tts_cache.key_for(tts.name, tts.cache_params(sentence, voice)) for sentence in sentences]
+    key = tts_cache.key_for(tts.name, {'segments': segment_keys})
+    path = tts_cache.get(key)
+    if path:
+        logger.info(f"TTS cache hit for {len(sentences)} joined segments in {tts.name} voice {voice}: {key}")
+        return path
     
-    if not elevenlabs_api_key:
-        logger.error("Eleven Labs API key is not set")
-        return None
+    def join_into_cache():
+        if tts_cache.contains(key):
+            return tts_cache.path(key)
+        
+        # Bounded per greeting; the provider's concurrency cap also bounds how many reach the API at once
+        with ThreadPoolExecutor(max_workers=max(1, min(tts_segment_workers, len(sentences)))) as pool:
+            segment_paths = list(pool.map(lambda sentence: synthesize_text(tts, sentence, voice), sentences))
+        if not all(segment_paths):
+            return None
+        
+        tmp_path = tts_cache.temp_path()
+        try:
+            joined = AudioSegment.empty()
+            for segment_path in segment_paths:
+                joined += AudioSegment.from_file(segment_path, format='mp3')
+            joined.export(tmp_path, format='mp3')
+            return tts_cache.put(key, tmp_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
     
-    # Get the voice ID from the voice name
-    voice_id = elevenlabs_voices.get(voice_name)
-    if not voice_id:
-        logger.error(f"Voice {voice_name} not found in configured voices")
-        return None
+    return tts_flights.do(key, join_into_cache)
+
+def synthesize_speech(text, voice, provider='elevenlabs'):
+    """Return the cache path of the audio for text in a provider's voice, synthesizing it on a miss, or None.
+
+    With TTS_SENTENCE_SEGMENTS on, text of several sentences is synthesized
+    per sentence and joined; if joining fails (e.g. ffmpeg is missing) the
+    whole text is synthesized in one request instead.
+    """
+    tts = tts_providers[provider]
+    # Without ffmpeg pydub can't decode the segments, so don't pay for them
+    can_join = tts_sentence_segments and shutil.which(AudioSegment.converter)
+    sentences = split_sentences(text) if can_join else []
+    if len(sentences) > 1:
+        try:
+            path = synthesize_segmented(tts, sentences, voice)
+            if path:
+                return path
+        except Exception as e:
+            logger.warning(f"Could not join {len(sentences)} sentence segments, synthesizing the whole text: {str(e)}")
+    return synthesize_text(tts, text, voice)
+
+def generate_speech(text, voice_name, provider='elevenlabs', save_path=None, pins=None):
+    """Generate speech with a TTS provider and return a URL to the audio file and the provider that made it.
+
+    Audio comes from the TTS cache when the same text was synthesized with
+    the same voice and settings before. If the provider is slower than the
+    latency budget, the fallback provider's audio may be used instead. With
+    save_path, a copy is also kept there. With a pins list, the cached file
+    is pinned and its key appended, for the caller to unpin when done.
+    """
+    logger.info(f"Generating {tts_providers[provider].label} speech with voice: {voice_name}")
     
-    # Prepare API request
-    url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id}"
+    requested = provider
+    path, provider = tts_hedge.synthesize(text, voice_name, requested)
+    if path and pins is not None and not save_path:
+        # Other syntheses may have evicted the file since it was cached; synthesize it once more
+        if not tts_cache.pin(tts_cache.key_of(path)):
+            path, provider = tts_hedge.synthesize(text, voice_name, requested)
+            if path and not tts_cache.pin(tts_cache.key_of(path)):
+                path = None
+        if path:
+            pins.append(tts_cache.key_of(path))
+    if not path:
+        return None, None
     
-    headers = {
-        "Accept": "audio/mpeg",
-        "Content-Type": "application/json",
-        "xi-api-key": elevenlabs_api_key
-    }
+    # Twilio fetches the audio from the cache route, or from the MP3 folder for a saved copy
+    if save_path:
+        shutil.copyfile(path, save_path)
+        path = save_path
+        audio_url = f"{base_url}/static/mp3/{os.path.basename(save_path)}"
+    else:
+        audio_url = f"{base_url}/tts-audio/{tts_cache.key_of(path)}.mp3"
+    logger.info(f"{tts_providers[provider].label} audio at {path}, URL: {audio_url}")
+    if provider != requested:
+        logger.warning(f"Used {tts_providers[provider].label} audio instead of {tts_providers[requested].label} "
+                       f"for {len(text)} characters")
+    return audio_url, provider
+
+# A {column} or {column|default} placeholder in a greeting template
+GREETING_FIELD = re.compile(r'\{(\w+)(?:\|([^{}]*))?\}')
+
+def is_greeting_template(greeting):
+    return bool(greeting and GREETING_FIELD.search(greeting))
+
+def greeting_values(template, fields):
+    """The values a row fills into the placeholders of a greeting template, in order."""
+    return tuple(fields.get(m.group(1)) or m.group(2) or '' for m in GREETING_FIELD.finditer(template))
+
+def render_greeting(template, fields):
+    """Fill the placeholders of a greeting template from a row's fields.
+
+    A missing or empty field is replaced by the placeholder's default, or
+    removed when it has none.
+    """
+    return GREETING_FIELD.sub(lambda m: fields.get(m.group(1)) or m.group(2) or '', template)
+
+def needs_tts_synthesis(playback_mode, greeting, tts_provider):
+    """Whether a call's greeting is played from audio synthesized by an available TTS provider."""
+    provider = tts_providers.get(tts_provider)
+    return (playback_mode in ('tts_only', 'tts_mp3') and bool(greeting)
+            and provider is not None and provider.available())
+
+def synthesize_greeting(greeting, voice, save_name=None, provider='elevenlabs', pins=None):
+    """Synthesize a greeting with a TTS provider; return its audio URL and the provider that made it, or (None, None).
+
+    With save_name, the audio is kept in the MP3 folder under tts_<save_name>.mp3.
+    With pins, the cached audio is pinned as in generate_speech.
+    """
+    if provider == 'elevenlabs' and not voice:
+        voice = next(iter(elevenlabs_voices.keys()), None)
+    return generate_speech(
+        greeting,
+        voice,
+        provider,
+        save_path=os.path.join(app.config['UPLOAD_FOLDER'], f"tts_{save_name}.mp3") if save_name else None,
+        pins=pins
+    )
+
+def build_call_twiml(playback_mode, greeting='', mp3_file='', tts_provider='twilio', audio_url=None):
+    """Build the TwiML that plays a call's greeting and/or MP3.
+
+    greeting is the custom greeting, or empty for the default one. When the
+    greeting is synthesized by a TTS provider, audio_url is the audio;
+    without it the greeting falls back to Twilio text-to-speech.
+    """
+    response = VoiceResponse()
     
-    data = {
-        "text": text,
-        "model_id": "eleven_monolingual_v1",
-        "voice_settings": {
-            "stability": 0.5,
-            "similarity_boost": 0.5
-        }
-    }
+    # Add a pause to ensure audio starts playing correctly
+    response.pause(length=1)
     
-    try:
-        # Make the API request
-        logger.info(f"Making Eleven Labs API request for voice {voice_name} (ID: {voice_id})")
-        response = requests.post(url, json=data, headers=headers)
-        
-        if response.status_code == 200:
-            # If we need to save the file
-            if save_path:
-                # This is a custom path
-                file_path = save_path
+    # Handle different playback modes
+    if playback_mode in ('tts_only', 'tts_mp3'):
+        # Text-to-Speech, then the MP3 for tts_mp3
+        if needs_tts_synthesis(playback_mode, greeting, tts_provider):
+            if audio_url:
+                # Play the generated audio
+                response.play(audio_url)
             else:
-                # Generate a temporary file
-                file_name = f"elevenlabs_{uuid.uuid4()}.mp3"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], file_name)
-            
-            # Save the audio file
-            with open(file_path, 'wb') as f:
-                f.write(response.content)
-            
-            # Return the URL to the audio file
-            audio_url = f"{base_url}/static/mp3/{os.path.basename(file_path)}"
-            logger.info(f"Eleven Labs audio saved to {file_path}, URL: {audio_url}")
-            return audio_url
+                # Fallback to Twilio TTS
+                logger.warning(f"No {tts_providers[tts_provider].label} audio for the greeting, falling back to Twilio TTS")
+                response.say(greeting)
+        elif greeting:
+            response.say(greeting)
         else:
-            logger.error(f"Eleven Labs API error: {response.status_code} - {response.text}")
+            response.say("This is a test call from the Call Center Testing application.")
+    
+    if playback_mode in ('tts_mp3', 'mp3_only'):
+        if mp3_file and mp3_file in mp3_files:
+            mp3_url = f"{base_url}/static/mp3/{mp3_file}"
+            response.play(mp3_url)
+        else:
+            response.say("No MP3 file was selected or the file is not available.")
+    
+    return response
+
+class CallPlanStore:
+    """Call plans under short content-addressed tokens, with their TwiML rendered once.
+
+    A plan holds everything that decides a call's TwiML, including the URL
+    of any greeting audio synthesized before the campaign started, and its
+    token is a hash of the plan, so every call with the same settings shares
+    one entry. The first request for a token renders the TwiML; later
+    requests get the cached XML bytes.
+
+    Plans are registered by the campaigns that use them. When the last one
+    releases a plan it is retired, and dropped once Twilio has had `grace`
+    seconds to fetch it for calls still ringing. Beyond `max_plans` retired
+    plans, the least recently used are dropped early. Plans a running
+    campaign uses are never dropped.
+    """
+
+    def __init__(self, persist=False, max_plans=10000, grace=600):
+        self.persist = persist
+        self.max_plans = max_plans
+        self.grace = grace
+        self._plans = OrderedDict()
+        self._twiml = {}
+        self._owners = {}
+        self._retired = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._renders = 0
+        self._dropped = 0
+
+    @staticmethod
+    def token_for(plan):
+        return hashlib.sha256(json.dumps(plan, sort_keys=True).encode()).hexdigest()[:16]
+
+    def register(self, plan, owner=None):
+        """Store a plan used by the campaign with ID owner and return its token."""
+        token = self.token_for(plan)
+        with self._lock:
+            new = token not in self._plans
+            self._plans[token] = plan
+            self._plans.move_to_end(token)
+            if owner:
+                self._owners.setdefault(token, set()).add(owner)
+                self._retired.pop(token, None)
+            elif new:
+                self._retired[token] = time.monotonic()
+            dropped = self._evict()
+        if self.persist:
+            if new:
+                campaign_store.save_call_plan(token, plan)
+            self._forget(dropped)
+        return token
+
+    def release(self, owner):
+        """Retire the plans that only the campaign with ID owner was using."""
+        now = time.monotonic()
+        with self._lock:
+            for token in [token for token, owners in self._owners.items() if owner in owners]:
+                self._owners[token].discard(owner)
+                if not self._owners[token]:
+                    del self._owners[token]
+                    self._retired[token] = now
+            dropped = self._evict()
+        self._forget(dropped)
+
+    def _evict(self):
+        """Drop retired plans past their grace period, then the least recently used retired ones beyond the cap.
+
+        Returns the dropped tokens.
+        """
+        now = time.monotonic()
+        expired = [token for token, retired_at in self._retired.items() if now - retired_at >= self.grace]
+        excess = len(self._retired) - len(expired) - self.max_plans
+        if excess > 0:
+            stale = set(expired)
+            expired += islice((token for token in self._plans if token in self._retired and token not in stale), excess)
+        for token in expired:
+            self._drop(token)
+        return expired
+
+    def _drop(self, token):
+        self._plans.pop(token, None)
+        self._twiml.pop(token, None)
+        self._retired.pop(token, None)
+        self._dropped += 1
+
+    def _forget(self, tokens):
+        if self.persist and tokens:
+            campaign_store.delete_call_plans(tokens)
+
+    def plan(self, token):
+        with self._lock:
+            plan = self._plans.get(token)
+            if plan is not None:
+                self._plans.move_to_end(token)
+        if plan is None and self.persist:
+            record = campaign_store.load_call_plan(token)
+            if record:
+                plan, twiml = record
+                with self._lock:
+                    self._plans[token] = plan
+                    if token not in self._owners:
+                        self._retired.setdefault(token, time.monotonic())
+                    if twiml is not None:
+                        self._twiml[token] = twiml
+                    self._evict()
+        return plan
+
+    def twiml(self, token):
+        """Return the TwiML of a plan as XML bytes, rendering it on first use, or None for an unknown token."""
+        with self._lock:
+            twiml = self._twiml.get(token)
+            if twiml is not None:
+                self._hits += 1
+                return twiml
+        
+        plan = self.plan(token)
+        if plan is None:
             return None
-    except Exception as e:
-        logger.error(f"Exception during Eleven Labs API call: {str(e)}", exc_info=True)
-        return None
+        
+        twiml = str(build_call_twiml(
+            plan['playback_mode'], plan['greeting'], plan['mp3_file'], plan['tts_provider'], plan['audio_url']
+        )).encode()
+        with self._lock:
+            if token in self._plans:
+                self._twiml[token] = twiml
+            self._renders += 1
+        if self.persist:
+            campaign_store.save_call_plan(token, plan, twiml)
+        return twiml
+
+    def stats(self):
+        with self._lock:
+            return {
+                'plans': len(self._plans),
+                'retired': len(self._retired),
+                'rendered': len(self._twiml),
+                'renders': self._renders,
+                'hits': self._hits,
+                'dropped': self._dropped
+            }
+
+call_plans = CallPlanStore(call_plan_persist, call_plan_max, call_plan_grace)
 
 @app.route('/twiml', methods=['GET', 'POST'])
 def twiml():
-    """Generate TwiML for the call."""
+    """Serve TwiML for calls whose TwiML was not sent inline when they were created."""
+    # Calls placed by campaigns carry only the token of their call plan
+    token = request.args.get('plan')
+    if token:
+        twiml = call_plans.twiml(token)
+        if twiml is not None:
+            return Response(twiml, mimetype='text/xml')
+        logger.warning(f"Unknown call plan token: {token}")
+        response = VoiceResponse()
+        response.say("This is a test call from the Call Center Testing application.")
+        return Response(str(response), mimetype='text/xml')
+    
     # Get parameters
     use_custom_greeting = request.args.get('use_custom_greeting') == 'true'
     custom_greeting = request.args.get('greeting', '')
@@ -1424,84 +5139,30 @@ def twiml():
     mp3_file = request.args.get('mp3_file', '')
     tts_provider = request.args.get('tts_provider', 'twilio')
     voice = request.args.get('voice', '')
-    save_tts = request.args.get('save_tts') == 'true'
-    call_id = request.args.get('call_id', '')
     
     logger.info(f"TwiML request - Playback Mode: {playback_mode}, MP3 File: {mp3_file}, TTS Provider: {tts_provider}, Voice: {voice}")
     
-    # Create TwiML response
-    response = VoiceResponse()
-    
-    # Add a pause to ensure audio starts playing correctly
-    response.pause(length=1)
-    
-    # Handle different playback modes
-    if playback_mode == 'tts_only':
-        # Text-to-Speech Only
-        if use_custom_greeting and custom_greeting:
-            if tts_provider == 'elevenlabs' and elevenlabs_api_key:
-                # Generate Eleven Labs speech
-                audio_url = generate_elevenlabs_speech(
-                    custom_greeting, 
-                    voice if voice else next(iter(elevenlabs_voices.keys()), None),
-                    save_path=os.path.join(app.config['UPLOAD_FOLDER'], f"tts_{call_id}.mp3") if save_tts else None
-                )
-                
-                if audio_url:
-                    # Play the generated audio
-                    response.play(audio_url)
-                else:
-                    # Fallback to Twilio TTS
-                    logger.warning("Falling back to Twilio TTS due to Eleven Labs error")
-                    response.say(custom_greeting)
-            else:
-                response.say(custom_greeting)
-        else:
-            response.say("This is a test call from the Call Center Testing application.")
-    
-    elif playback_mode == 'tts_mp3':
-        # Text-to-Speech + MP3
-        if use_custom_greeting and custom_greeting:
-            if tts_provider == 'elevenlabs' and elevenlabs_api_key:
-                # Generate Eleven Labs speech
-                audio_url = generate_elevenlabs_speech(
-                    custom_greeting, 
-                    voice if voice else next(iter(elevenlabs_voices.keys()), None),
-                    save_path=os.path.join(app.config['UPLOAD_FOLDER'], f"tts_{call_id}.mp3") if save_tts else None
-                )
-                
-                if audio_url:
-                    # Play the generated audio
-                    response.play(audio_url)
-                else:
-                    # Fallback to Twilio TTS
-                    logger.warning("Falling back to Twilio TTS due to Eleven Labs error")
-                    response.say(custom_greeting)
-            else:
-                response.say(custom_greeting)
-        else:
-            response.say("This is a test call from the Call Center Testing application.")
-        
-        # Then play MP3
-        if mp3_file and mp3_file in mp3_files:
-            mp3_url = f"{base_url}/static/mp3/{mp3_file}"
-            response.play(mp3_url)
-        else:
-            response.say("No MP3 file was selected or the file is not available.")
-    
-    elif playback_mode == 'mp3_only':
-        # MP3 Only
-        if mp3_file and mp3_file in mp3_files:
-            mp3_url = f"{base_url}/static/mp3/{mp3_file}"
-            response.play(mp3_url)
-        else:
-            response.say("No MP3 file was selected or the file is not available.")
+    # Synthesis happens before campaigns dial, never while Twilio waits on this webhook,
+    # so synthesized greetings requested this way are spoken with Twilio text-to-speech
+    response = build_call_twiml(
+        playback_mode,
+        custom_greeting if use_custom_greeting else '',
+        mp3_file,
+        tts_provider
+    )
     
     # Log the TwiML for debugging
     logger.info(f"Generated TwiML: {response}")
     
     return Response(str(response), mimetype='text/xml')
 
+@app.route('/tts-audio/<key>.mp3')
+def tts_audio(key):
+    """Serve synthesized audio from the TTS cache to Twilio, wherever TTS_CACHE_DIR is."""
+    if not re.fullmatch(r'[0-9a-f]{32}', key) or not tts_cache.contains(key):
+        abort(404)
+    return send_from_directory(os.path.abspath(tts_cache.directory), f"{key}.mp3", mimetype='audio/mpeg')
+
 # Define a common function to get logout button HTML
 def get_logout_button_html():
     """Return the HTML for the logout button"""
@@ -2337,6 +5998,70 @@ def api_mp3_files():
     mp3_files = get_mp3_files()
     return jsonify({"mp3_files": mp3_files})
 
+@app.route('/api/dispatcher-stats', methods=['GET'])
+@login_required
+def api_dispatcher_stats():
+    """API endpoint to get call dispatcher queue depth, worker utilization and CPS limiter state."""
+    stats = dispatcher.stats()
+    stats['rate_limiter'] = call_rate_limiter.stats()
+    stats['call_plans'] = call_plans.stats()
+    stats['tts_cache'] = tts_cache.stats()
+    stats['tts_single_flight'] = tts_flights.stats()
+    stats['tts_hedging'] = tts_hedge.stats()
+    stats['tts_latency'] = {name: histogram.stats() for name, histogram in tts_latency.items()}
+    return jsonify(stats)
+
+@app.route('/api/campaigns', methods=['GET'])
+@login_required
+def api_campaigns():
+    """API endpoint to list campaigns with their status and counters."""
+    return jsonify({"campaigns": [c.to_dict() for c in list_campaigns()]})
+
+@app.route('/api/campaigns/<campaign_id>/stop', methods=['POST'])
+@login_required
+def api_stop_campaign(campaign_id):
+    """API endpoint to stop a campaign, hanging up its live calls unless hang_up=false."""
+    campaign = get_campaign(campaign_id)
+    if not campaign:
+        return jsonify({"status": "error", "message": f"Unknown campaign: {campaign_id}"}), 404
+    hang_up = request.values.get('hang_up', 'true').lower() != 'false'
+    logger.info(f"Received stop request for campaign {campaign_id} over HTTP, hang_up={hang_up}")
+    stop_campaign(campaign, hang_up)
+    return jsonify({"status": "success", "campaign": campaign.to_dict()})
+
+@app.route('/api/number-lists', methods=['GET', 'POST'])
+@login_required
+def api_number_lists():
+    """API endpoint to list uploaded number lists, or import a CSV/TXT list streamed as the request body."""
+    if request.method == 'GET':
+        return jsonify({"number_lists": list_number_lists()})
+    
+    # Read the body as it arrives instead of letting Flask buffer it as form data
+    stream = get_input_stream(request.environ, max_content_length=number_list_max_bytes)
+    lines = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        meta = import_number_list(lines, request.args.get('name', ''))
+    except Exception as e:
+        logger.error(f"Error importing number list: {str(e)}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "success", "list": meta})
+
+@app.route('/api/dnc', methods=['GET', 'POST'])
+@login_required
+def api_dnc():
+    """API endpoint to get the do-not-call list's size, or add (or with ?mode=replace, replace) numbers from a streamed CSV/TXT body."""
+    if request.method == 'GET':
+        return jsonify(dnc_list.stats())
+    
+    stream = get_input_stream(request.environ, max_content_length=number_list_max_bytes)
+    lines = io.TextIOWrapper(io.BufferedReader(stream), encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        result = update_dnc_list(lines, replace=request.args.get('mode') == 'replace')
+    except Exception as e:
+        logger.error(f"Error updating do-not-call list: {str(e)}", exc_info=True)
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "success", "dnc": result})
+
 @app.route('/api/eleven-labs-voices', methods=['GET'])
 @login_required
 def api_eleven_labs_voices():
@@ -2439,7 +6164,7 @@ def test_call():
             raise ValueError("Phone number is required")
         
         # Make the test call
-        call = client.calls.create(
+        call = create_call(
             to=test_number,
             from_=twilio_number,
             url=f"{base_url}/test-twiml"
@@ -2795,4 +6520,11 @@ if __name__ == '__main__':
     logger.info(f"Twilio Number: {twilio_number}")
     logger.info(f"MP3 Files: {mp3_files}")
     logger.info("Starting Flask application on port 5005")
-    socketio.run(app, host='0.0.0.0', port=5005, debug=True)
\ No newline at end of file
+    
+    debug = os.environ.get('DEBUG', 'True').lower() in ('1', 'true', 'yes')
+    
+    # With the debug reloader this block also runs in a watcher process that never serves;
+    # campaigns are resumed once, in the process that serves requests
+    if not debug or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        resume_campaigns()
+    socketio.run(app, host='0.0.0.0', port=5005, debug=debug)
\ No newline at end of file